@@ -0,0 +1,324 @@
+"""Benchmarks for the CheckerBoard engine and the SimpleAI search.
+
+Runs perft (the number of legal move sequences of a given depth) from the starting position and from stored midgame
+and endgame positions, checking each count against the known-correct value, and times the board operations, the
+SimpleAI tree expansion, including the memory taken per tree node, position evaluation and batched random play.
+Results are printed as a table and can be written as JSON to be compared between commits:
+
+    python benchmark.py --output before.json
+    python benchmark.py --quick
+"""
+from board import CheckerBoard
+from players.simple_ai import SearchTree
+import argparse
+import copy
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+
+"""
+Stored perft positions.
+
+Rows are listed from row 0 (white's back rank) up. 'w', 'W', 'b', 'B' are white pawn, white king, black pawn and black
+king, any other character is an empty square. A position without rows is the starting position. perft[i] is the known
+leaf count at depth i + 1, and quick_depth is the depth used with --quick.
+"""
+PERFT_POSITIONS = [
+    {'name': 'start-4', 'board_size': 4, 'player': 'w', 'rows': None, 'quick_depth': 6,
+     'perft': [3, 9, 12, 16, 22, 26, 40, 59, 105]},
+    {'name': 'midgame-4', 'board_size': 4, 'player': 'b', 'rows': ['.B..', '....', '....', 'W.W.'], 'quick_depth': 6,
+     'perft': [2, 6, 11, 27, 33, 81, 136, 328, 404]},
+    {'name': 'endgame-4', 'board_size': 4, 'player': 'w', 'rows': ['.W..', '....', '...B', 'b...'], 'quick_depth': 6,
+     'perft': [2, 4, 5, 13, 24, 43, 55, 134, 257]},
+    {'name': 'start-6', 'board_size': 6, 'player': 'w', 'rows': None, 'quick_depth': 5,
+     'perft': [5, 25, 106, 369, 1273, 4258, 13177]},
+    {'name': 'midgame-6', 'board_size': 6, 'player': 'b',
+     'rows': ['.w....', 'w.....', '.....w', '..w...', '.b....', 'b.b.W.'], 'quick_depth': 5,
+     'perft': [1, 5, 17, 72, 262, 1071, 3332, 13893]},
+    {'name': 'endgame-6', 'board_size': 6, 'player': 'w',
+     'rows': ['......', '..w.B.', '......', '......', '......', '....W.'], 'quick_depth': 5,
+     'perft': [4, 13, 50, 81, 297, 921, 3320, 6448]},
+    {'name': 'start-8', 'board_size': 8, 'player': 'w', 'rows': None, 'quick_depth': 4,
+     'perft': [7, 49, 302, 1469, 7361, 37205]},
+    {'name': 'midgame-8', 'board_size': 8, 'player': 'b',
+     'rows': ['.w.w.w..', '..w.w...', '.w.....w', 'w.....w.', '.b.b....', '..b.....', '.b.b...b', 'b.b...b.'],
+     'quick_depth': 4, 'perft': [7, 49, 282, 1625, 8572, 43970]},
+    {'name': 'endgame-8', 'board_size': 8, 'player': 'b',
+     'rows': ['.......w', 'b.......', '.....w..', '........', '........', 'W.......', '.......b', '....W...'],
+     'quick_depth': 5, 'perft': [2, 14, 42, 313, 1040, 7401, 27620]},
+    {'name': 'start-10', 'board_size': 10, 'player': 'w', 'rows': None, 'quick_depth': 3,
+     'perft': [9, 81, 658, 4265, 26875]},
+    {'name': 'midgame-10', 'board_size': 10, 'player': 'w',
+     'rows': ['.w.w...w.w', 'w.w.w.w.w.', '.w.w...w.w', 'w.........', '.....b...b',
+              '........b.', '.b.....b..', 'b.b...b.b.', '...b.b....', 'b.b.b.b.b.'],
+     'quick_depth': 3, 'perft': [9, 107, 916, 10864]},
+    {'name': 'endgame-10', 'board_size': 10, 'player': 'b',
+     'rows': ['.....B...w', '..........', '...w......', '......w...', '...w......',
+              '..........', '.b.b......', '..........', '.....w....', 'b.......b.'],
+     'quick_depth': 3, 'perft': [9, 64, 420, 2821, 18868]},
+    {'name': 'start-12', 'board_size': 12, 'player': 'w', 'rows': None, 'quick_depth': 3,
+     'perft': [11, 121, 1222, 10053]},
+    {'name': 'midgame-12', 'board_size': 12, 'player': 'w',
+     'rows': ['.w.w.w.w.w.w', '......w.w.w.', '.w.w...w.w.w', 'w.w...w.b.w.', '.w..........', '....w.......',
+              '.b.........b', '..b.........', '.b.b.b.w.b.b', '..b.b.b...b.', '.....b.b.b.b', 'b.b.b.b.b.b.'],
+     'quick_depth': 4, 'perft': [2, 2, 40, 703, 12278]},
+    {'name': 'endgame-12', 'board_size': 12, 'player': 'b',
+     'rows': ['............', '..........w.', '............', '....b.....w.', '...w........', '............',
+              '............', '..b.........', '...b.......b', '........w...', '...........w', 'W...........'],
+     'quick_depth': 3, 'perft': [6, 60, 382, 3485, 21912]},
+]
+
+# Board sizes and time in seconds spent expanding the SimpleAI game tree
+SEARCH_BENCHMARKS = [(8, 1.0), (10, 1.0)]
+
+
+def build_position(position):
+    """Creates the CheckerBoard described by an entry of PERFT_POSITIONS."""
+    if position['rows'] is None:
+        return CheckerBoard(position['board_size'])
+    pieces = [(char, (row_ind, col_ind))
+              for row_ind, row in enumerate(position['rows'])
+              for col_ind, char in enumerate(row) if char in 'wWbB']
+    return CheckerBoard.from_pieces(position['board_size'], pieces, position['player'])
+
+
+def perft(board, depth):
+    """Counts the leaf nodes of the legal move tree of the given depth below board."""
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in board.legal_moves():
+        record = board.apply_move(move)
+        nodes += perft(board, depth - 1)
+        board.undo_move(record)
+    return nodes
+
+
+def run_perft(quick=False):
+    results = []
+    for position in PERFT_POSITIONS:
+        depth = position['quick_depth'] if quick else len(position['perft'])
+        board = build_position(position)
+        start_time = time.perf_counter()
+        nodes = perft(board, depth)
+        elapsed = time.perf_counter() - start_time
+        expected = position['perft'][depth - 1]
+        results.append({'name': position['name'], 'board_size': position['board_size'], 'depth': depth,
+                        'nodes': nodes, 'expected': expected, 'ok': nodes == expected,
+                        'seconds': elapsed, 'nodes_per_second': nodes / elapsed if elapsed > 0 else None})
+    return results
+
+
+def _time_calls(func, min_time):
+    """Calls func repeatedly for at least min_time seconds and returns (calls, seconds per call)."""
+    calls = 0
+    start_time = time.perf_counter()
+    elapsed = 0
+    while elapsed < min_time:
+        func()
+        calls += 1
+        elapsed = time.perf_counter() - start_time
+    return calls, elapsed / calls
+
+
+def run_operations(min_time):
+    """Times the individual board operations used by players and the referee, on each stored position."""
+    results = []
+    for position in PERFT_POSITIONS:
+        board = build_position(position)
+        pieces = board.get_locations_by_color(board.current_player)
+        moves = board.legal_moves()
+
+        def generate():
+            for piece in pieces:
+                board.generate_moves(piece)
+
+        def execute():
+            for move in moves:
+                copy.deepcopy(board).execute_move(move)
+
+        def apply_undo():
+            for move in moves:
+                board.undo_move(board.apply_move(move))
+
+        def deepcopy():
+            copy.deepcopy(board)
+
+        for name, func, per_call in (('generate_moves', generate, len(pieces)),
+                                     ('deepcopy+execute_move', execute, len(moves)),
+                                     ('apply_move+undo_move', apply_undo, len(moves)),
+                                     ('deepcopy', deepcopy, 1)):
+            if per_call == 0:
+                continue
+            calls, seconds = _time_calls(func, min_time)
+            results.append({'name': position['name'], 'operation': name, 'calls': calls * per_call,
+                            'seconds_per_call': seconds / per_call})
+    return results
+
+
+def run_search(duration_scale=1.0, memory_nodes=50000):
+    """Measures how many nodes the SimpleAI breadth-first expansion creates per second, and the memory they take.
+
+    Memory is traced in a separate expansion of memory_nodes nodes, as tracing slows down the expansion.
+    """
+    results = []
+    for board_size, duration in SEARCH_BENCHMARKS:
+        duration *= duration_scale
+        tree = SearchTree(CheckerBoard(board_size), 'w')
+        expanded = 0
+        start_time = time.perf_counter()
+        end_time = start_time + duration
+        while time.perf_counter() < end_time and tree.expand_next():
+            expanded += 1
+        elapsed = time.perf_counter() - start_time
+        created = len(tree) - 1
+        del tree
+
+        tracemalloc.start()
+        tree = SearchTree(CheckerBoard(board_size), 'w')
+        while len(tree) < memory_nodes and tree.expand_next():
+            pass
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({'board_size': board_size, 'seconds': elapsed, 'expanded': expanded,
+                        'nodes': created, 'nodes_per_second': created / elapsed,
+                        'bytes_per_node': memory / len(tree)})
+        del tree
+    return results
+
+
+def run_evaluation(min_time):
+    """Compares the per leaf SearchTree material count with the BatchEvaluator, on the leaves of a perft tree.
+
+    Returns an empty list if numpy, which the BatchEvaluator requires, is not installed.
+    """
+    try:
+        from players.batch_eval import BatchEvaluator
+    except ImportError:
+        return []
+    results = []
+    for board_size, depth in ((8, 4), (10, 3)):
+        leaves = []
+        _collect_leaves(CheckerBoard(board_size), depth, leaves)
+        evaluator = BatchEvaluator(board_size)
+
+        def per_leaf():
+            for leaf in leaves:
+                SearchTree.evaluate(leaf, 'w')
+
+        def batch():
+            evaluator.evaluate(leaves, 'w')
+
+        for name, func in (('SearchTree', per_leaf), ('BatchEvaluator', batch)):
+            _, seconds = _time_calls(func, min_time)
+            results.append({'board_size': board_size, 'evaluator': name, 'positions': len(leaves),
+                            'positions_per_second': len(leaves) / seconds})
+    return results
+
+
+def run_simulation(num_games):
+    """Compares random play on CheckerBoards, one game at a time, with the BatchSimulator playing all games at once.
+
+    Returns an empty list if numpy, which the BatchSimulator requires, is not installed.
+    """
+    try:
+        from simulator import BatchSimulator, ONGOING
+    except ImportError:
+        return []
+    from random import Random
+    results = []
+    for board_size in (8, 10):
+        rng = Random(board_size)
+        moves = 0
+        start_time = time.perf_counter()
+        for _ in range(num_games):
+            board = CheckerBoard(board_size)
+            while board.get_winner() is None:
+                board.apply_move(rng.choice(board.legal_moves()))
+                moves += 1
+        elapsed = time.perf_counter() - start_time
+        results.append({'board_size': board_size, 'simulator': 'CheckerBoard', 'games': num_games, 'moves': moves,
+                        'moves_per_second': moves / elapsed})
+
+        import numpy as np
+        rng = np.random.default_rng(board_size)
+        start_time = time.perf_counter()
+        simulator = BatchSimulator(board_size, num_games)
+        while (simulator.results == ONGOING).any():
+            simulator.step(simulator.random_actions(rng))
+        elapsed = time.perf_counter() - start_time
+        moves = int(simulator.moves.sum())
+        results.append({'board_size': board_size, 'simulator': 'BatchSimulator', 'games': num_games, 'moves': moves,
+                        'moves_per_second': moves / elapsed})
+    return results
+
+
+def _collect_leaves(board, depth, leaves):
+    if depth == 0:
+        leaves.append(board.copy())
+        return
+    for move in board.legal_moves():
+        record = board.apply_move(move)
+        _collect_leaves(board, depth - 1, leaves)
+        board.undo_move(record)
+
+
+def print_results(results):
+    print('{:<12} {:>5} {:>10} {:>10} {:>8} {:>12}'.format('perft', 'depth', 'nodes', 'expected', 'ok',
+                                                           'nodes/s'))
+    for r in results['perft']:
+        print('{:<12} {:>5} {:>10} {:>10} {:>8} {:>12.0f}'.format(r['name'], r['depth'], r['nodes'], r['expected'],
+                                                                  str(r['ok']), r['nodes_per_second'] or 0))
+    print()
+    print('{:<12} {:<22} {:>14}'.format('position', 'operation', 'usec/call'))
+    for r in results['operations']:
+        print('{:<12} {:<22} {:>14.2f}'.format(r['name'], r['operation'], r['seconds_per_call'] * 1e6))
+    print()
+    print('{:<12} {:>10} {:>12} {:>12}'.format('search', 'nodes', 'nodes/s', 'bytes/node'))
+    for r in results['search']:
+        print('{:<12} {:>10} {:>12.0f} {:>12.1f}'.format('SimpleAI-{}'.format(r['board_size']), r['nodes'],
+                                                         r['nodes_per_second'], r['bytes_per_node']))
+    if results['evaluation']:
+        print()
+        print('{:<12} {:<16} {:>10} {:>14}'.format('evaluation', 'evaluator', 'positions', 'positions/s'))
+        for r in results['evaluation']:
+            print('{:<12} {:<16} {:>10} {:>14.0f}'.format('board-{}'.format(r['board_size']), r['evaluator'],
+                                                          r['positions'], r['positions_per_second']))
+    if results['simulation']:
+        print()
+        print('{:<12} {:<16} {:>10} {:>14}'.format('simulation', 'simulator', 'moves', 'moves/s'))
+        for r in results['simulation']:
+            print('{:<12} {:<16} {:>10} {:>14.0f}'.format('board-{}'.format(r['board_size']), r['simulator'],
+                                                          r['moves'], r['moves_per_second']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the CheckerBoard engine and SimpleAI.')
+    parser.add_argument('--quick', action='store_true', help='use smaller perft depths and shorter timings')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'quick': args.quick,
+        'perft': run_perft(args.quick),
+        'operations': run_operations(0.05 if args.quick else 0.2),
+        'search': run_search(0.2 if args.quick else 1.0, 10000 if args.quick else 50000),
+        'evaluation': run_evaluation(0.05 if args.quick else 0.2),
+        'simulation': run_simulation(100 if args.quick else 1000),
+    }
+    results['ok'] = all(r['ok'] for r in results['perft'])
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not results['ok']:
+        print('Perft counts do not match the stored values!')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
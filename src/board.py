@@ -1,10 +1,103 @@
 from players.console import ConsolePlayer
 from players.simple_ai import SimpleAI
 from threading import Thread
-import copy
+import collections
+import random
+import time
 from random import choice
 
 
+# Moves without a capture or promotion to king after which the game ends
+END_GAME_MOVE_LIMIT = 40
+# Number of end game counter values sharing a Zobrist key
+END_GAME_BUCKET_SIZE = 10
+
+
+class BoardGeometry:
+    """Precomputed square masks for a given board size.
+
+    Squares are addressed by bit index ``row * board_size + col``. A diagonal step in direction ``(dr, dc)`` is then a
+    shift of ``dr * board_size + dc`` bits, and the source masks below keep pieces from wrapping around the board edges.
+    Geometries are immutable and shared between every board of the same size, see :meth:`for_size`.
+    """
+    # White man steps first, then black man steps. Kings use all four, in this order.
+    DIRECTIONS = ((1, -1), (1, 1), (-1, -1), (-1, 1))
+    _cache = {}
+
+    def __init__(self, board_size):
+        n = board_size
+        self.board_size = n
+        self.locations = tuple((sq // n, sq % n) for sq in range(n * n))
+        self.playable = sum(1 << (r * n + c) for r in range(n) for c in range(n) if (r + c) % 2 == 1)
+        self.shifts = tuple(dr * n + dc for dr, dc in self.DIRECTIONS)
+        self.step_sources = tuple(self._sources(dr, dc, 1) for dr, dc in self.DIRECTIONS)
+        self.jump_sources = tuple(self._sources(dr, dc, 2) for dr, dc in self.DIRECTIONS)
+        # Last row for each color, where men are promoted
+        self.promotion_rows = {'w': sum(1 << ((n - 1) * n + c) for c in range(n)) & self.playable,
+                               'b': sum(1 << c for c in range(n)) & self.playable}
+        # Per square neighbor table: (direction index, step square, jump square or -1)
+        self.neighbors = tuple(self._square_neighbors(sq) for sq in range(n * n))
+        # Zobrist keys, seeded by board size so hashes are identical in every process
+        rng = random.Random(board_size)
+        self.zobrist_pieces = {piece: tuple(rng.getrandbits(64) for _ in range(n * n)) for piece in 'wWbB'}
+        self.zobrist_black_to_move = rng.getrandbits(64)
+        self.zobrist_end_game = tuple(rng.getrandbits(64)
+                                      for _ in range(END_GAME_MOVE_LIMIT // END_GAME_BUCKET_SIZE + 1))
+
+    @classmethod
+    def for_size(cls, board_size):
+        """Returns the shared geometry for board_size, building it on first use."""
+        geometry = cls._cache.get(board_size)
+        if geometry is None:
+            geometry = cls._cache[board_size] = cls(board_size)
+        return geometry
+
+    def _sources(self, dr, dc, distance):
+        n = self.board_size
+        return sum(1 << (r * n + c) for r in range(n) for c in range(n)
+                   if (r + c) % 2 == 1 and 0 <= r + distance * dr < n and 0 <= c + distance * dc < n)
+
+    def _square_neighbors(self, sq):
+        neighbors = []
+        for d, shift in enumerate(self.shifts):
+            if self.step_sources[d] >> sq & 1:
+                jump = sq + 2 * shift if self.jump_sources[d] >> sq & 1 else -1
+                neighbors.append((d, sq + shift, jump))
+        return tuple(neighbors)
+
+    def square(self, loc):
+        """Returns the bit index of a (row, col) location."""
+        return loc[0] * self.board_size + loc[1]
+
+
+UndoRecord = collections.namedtuple('UndoRecord', ['from_sq', 'to_sq', 'captured', 'captured_kings', 'promoted',
+                                                   'end_game_move_count', 'piece_hash', 'legal_cache'])
+UndoRecord.__doc__ = """Changes made by CheckerBoard.apply_move.
+
+Squares are bit indices, captured and captured_kings are bitboards of the opponent pieces removed by the move, promoted
+indicates a pawn became a king, and end_game_move_count and piece_hash are the values before the move. legal_cache
+holds the legal move cache from before the move, so undoing the move does not need to generate the moves again.
+"""
+
+
+def _shift(bb, shift):
+    return bb << shift if shift > 0 else bb >> -shift
+
+
+def _iter_squares(bb, reverse=False):
+    """Yields the indices of the set bits of bb, lowest first unless reverse is set."""
+    if reverse:
+        while bb:
+            sq = bb.bit_length() - 1
+            bb ^= 1 << sq
+            yield sq
+    else:
+        while bb:
+            low = bb & -bb
+            bb ^= low
+            yield low.bit_length() - 1
+
+
 class CheckerBoard:
     """The CheckerBoard manages a Checkers match between two players."""
     def __init__(self, board_size):
@@ -24,35 +117,156 @@ class CheckerBoard:
 
         """
         Build board to desired size.
-        
-        The board is represented by a 2D array of characters. Each element is
-        either a 'b', 'B', 'w', 'W', 0, or '_'. These represent a black pawn,
-        black king, white pawn, white king, empty space, or invalid space. 
+
+        The board is represented by three bitboards: the squares holding white pieces, the squares holding black
+        pieces and the squares holding kings of either color. Bit ``row * board_size + col`` represents a square.
+        """
+        self._geometry = BoardGeometry.for_size(board_size)
+        player_rows = (board_size // 2) - 1
+        row_mask = (1 << board_size) - 1
+        self._white = sum(row_mask << (r * board_size) for r in range(player_rows)) & self._geometry.playable
+        self._black = sum(row_mask << (r * board_size)
+                          for r in range(player_rows + 2, board_size)) & self._geometry.playable
+        self._kings = 0
+        self._piece_hash = self._compute_piece_hash()  # Zobrist hash of the pieces, see zobrist_hash
+        # Number of pieces of each color, kept up to date as pieces are captured
+        self._white_count = bin(self._white).count('1')
+        self._black_count = bin(self._black).count('1')
+        self._rows = None  # Cached list of lists view, see __getitem__
+        # Cached legal moves, valid while the position matches _legal_key
+        self._legal_key = None
+        self._legal_moves = None
+        self._legal_move_set = None
+
+    @classmethod
+    def from_pieces(cls, board_size, pieces, current_player='w', end_game_move_count=0):
+        """Creates a board holding only the specified pieces.
+
+        :param board_size: Size of the square board to be used. Must be even and >= 4.
+        :param pieces: List of tuples in the format returned by get_pieces, eg, [('w', (0, 1)), ('B', (3, 2))]
+        :param current_player: 'w' or 'b', the player to move
+        :param end_game_move_count: Number of moves since the last capture or promotion to king
+        :raises ValueError: if board_size is invalid or a piece is not on a valid space of the board
         """
-        self._board = []
-        player_rows = (board_size / 2) - 1
-        # Add white player rows
-        row_ind = 0
-        while row_ind < player_rows:
-            row = ['_' if (j + (row_ind % 2)) % 2 == 0 else 'w' for j in range(board_size)]
-            self._board.append(row)
-            row_ind += 1
-        # Add neutral rows
-        while row_ind < player_rows + 2:
-            row = ['_' if (j + (row_ind % 2)) % 2 == 0 else 0 for j in range(board_size)]
-            self._board.append(row)
-            row_ind += 1
-        # Add black player rows
-        while row_ind < board_size:
-            row = ['_' if (j + (row_ind % 2)) % 2 == 0 else 'b' for j in range(board_size)]
-            self._board.append(row)
-            row_ind += 1
+        board = cls(board_size)
+        board._white = board._black = board._kings = 0
+        for piece, loc in pieces:
+            sq = board._geometry.square(loc)
+            if not (0 <= loc[0] < board_size and 0 <= loc[1] < board_size and board._geometry.playable >> sq & 1):
+                raise ValueError('Invalid piece location {}'.format(loc))
+            if piece.lower() == 'w':
+                board._white |= 1 << sq
+            elif piece.lower() == 'b':
+                board._black |= 1 << sq
+            else:
+                raise ValueError('Invalid piece {}'.format(piece))
+            if piece.isupper():
+                board._kings |= 1 << sq
+        board.current_player = current_player
+        board._end_game_move_count = end_game_move_count
+        board._piece_hash = board._compute_piece_hash()
+        board._white_count = bin(board._white).count('1')
+        board._black_count = bin(board._black).count('1')
+        return board
+
+    @classmethod
+    def from_bitboards(cls, board_size, white, black, kings, current_player='w', end_game_move_count=0):
+        """Creates a board from bitboards, as returned by get_bitboards.
+
+        This is a cheap constructor for code which enumerates many positions. The bitboards are not validated.
+
+        :param board_size: Size of the square board to be used. Must be even and >= 4.
+        :param white: Bitboard of the white pieces, bit row * board_size + col representing a square
+        :param black: Bitboard of the black pieces
+        :param kings: Bitboard of the kings of either color
+        :param current_player: 'w' or 'b', the player to move
+        :param end_game_move_count: Number of moves since the last capture or promotion to king
+        """
+        board = cls.__new__(cls)
+        board._board_size = board_size
+        board.current_player = current_player
+        board._end_game_move_count = end_game_move_count
+        board._geometry = BoardGeometry.for_size(board_size)
+        board._white = white
+        board._black = black
+        board._kings = kings
+        board._piece_hash = board._compute_piece_hash()
+        board._white_count = bin(white).count('1')
+        board._black_count = bin(black).count('1')
+        board._rows = None
+        board._legal_key = None
+        board._legal_moves = None
+        board._legal_move_set = None
+        return board
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Creates a board which can be modified from a BoardSnapshot."""
+        return cls.from_bitboards(snapshot.board_size, snapshot.white, snapshot.black, snapshot.kings,
+                                  snapshot.current_player, snapshot.end_game_move_count)
+
+    def snapshot(self):
+        """Returns an immutable BoardSnapshot of the current position. This takes constant time."""
+        return BoardSnapshot(self._board_size, self._white, self._black, self._kings, self.current_player,
+                             self._end_game_move_count)
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def copy(self):
+        """Returns an independent copy of this board, sharing the immutable geometry tables."""
+        board = CheckerBoard.__new__(CheckerBoard)
+        board._board_size = self._board_size
+        board.current_player = self.current_player
+        board._end_game_move_count = self._end_game_move_count
+        board._geometry = self._geometry
+        board._white = self._white
+        board._black = self._black
+        board._kings = self._kings
+        board._piece_hash = self._piece_hash
+        board._white_count = self._white_count
+        board._black_count = self._black_count
+        board._rows = None
+        # The legal move cache is never modified in place, so it can be shared
+        board._legal_key = self._legal_key
+        board._legal_moves = self._legal_moves
+        board._legal_move_set = self._legal_move_set
+        return board
+
+    def serialize(self):
+        """Packs the position into a compact bytes object which can be sent to another process.
+
+        The format is the board size, the player to move (0 for white, 1 for black) and the end game counter as one
+        byte each, followed by the white, black and king bitboards as little endian integers.
+
+        :returns bytes: Packed position, see deserialize
+        """
+        length = (self._board_size * self._board_size + 7) // 8
+        return (bytes((self._board_size, 0 if self.current_player == 'w' else 1, self._end_game_move_count)) +
+                self._white.to_bytes(length, 'little') + self._black.to_bytes(length, 'little') +
+                self._kings.to_bytes(length, 'little'))
+
+    @classmethod
+    def deserialize(cls, data):
+        """Creates a board from a position packed by serialize.
+
+        :param data: Bytes returned by serialize
+        :raises ValueError: if data is not a packed position
+        """
+        board_size = data[0]
+        length = (board_size * board_size + 7) // 8
+        if board_size % 2 != 0 or board_size < 4 or len(data) != 3 + 3 * length:
+            raise ValueError('Invalid packed position')
+        return cls.from_bitboards(board_size, int.from_bytes(data[3:3 + length], 'little'),
+                                  int.from_bytes(data[3 + length:3 + 2 * length], 'little'),
+                                  int.from_bytes(data[3 + 2 * length:], 'little'),
+                                  'w' if data[1] == 0 else 'b', data[2])
 
     def print(self):
         """Prints a representation of the board to the console"""
         board = '   ' + ''.join(['{:^3}'.format(i) for i in range(self._board_size)]) + '\n'
         board += '\n'.join([''.join(['{:^3}'.format(item) for item in [row_ind] + row])
-                            for row_ind, row in enumerate(self._board)])
+                            for row_ind, row in enumerate(self._get_rows())])
         print(board)
 
     def execute_move(self, move):
@@ -63,89 +277,240 @@ class CheckerBoard:
         :param move: Move to execute
         :returns bool: true if move is executed successfully, false otherwise
         """
-        # TODO: Check whether move is valid format
-        valid_move = False
-        jump_or_king = False  # Indicates this move was a capture or a promotion to king
-        # Create temp backup of board in case moves need to be undone
-        temp_board = copy.deepcopy(self._board)
-        # Group moves into pairs to handle multiple jumps
-        move_pairs = [[move[i], move[i+1]] for i in range(len(move) - 1)]
-        for pair in move_pairs:
-            if self._validate_move(pair):
-                valid_move = True
-                self._board[pair[1][0]][pair[1][1]] = self._board[pair[0][0]][pair[0][1]]
-                self._board[pair[0][0]][pair[0][1]] = 0
-                # A pawn is promoted when it reaches the last row
-                if ((pair[1][0] == self._board_size - 1 and self.current_player == 'w') or
-                        (pair[1][0] == 0 and self.current_player == 'b')):
-                    # If piece was not already a king, this resets end game counter
-                    if self._board[pair[1][0]][pair[1][1]].islower():
-                        jump_or_king = True
-                    self._board[pair[1][0]][pair[1][1]] = self._board[pair[1][0]][pair[1][1]].upper()
-                # A piece is removed if jumped over
-                if abs(pair[1][0] - pair[0][0]) == 2:
-                    xp = (pair[0][0] + pair[1][0]) // 2
-                    yp = (pair[0][1] + pair[1][1]) // 2
-                    self._board[xp][yp] = 0
-                    jump_or_king = True
-            else:
-                valid_move = False
-                break
-        if valid_move:
-            # If move is valid, rotate to the next player
-            self.current_player = 'w' if self.current_player == 'b' else 'b'
-            if jump_or_king:
-                self._end_game_move_count = 0
+        if not self._validate_move(move):
+            return False
+        self.apply_move(move)
+        return True
+
+    def apply_move(self, move):
+        """Executes a move known to be valid, without validating it.
+
+        This is the fast path for players searching the game tree: the board is changed in place and the returned
+        record restores it when passed to undo_move. Moves must be undone in the reverse order they were applied.
+
+        :param move: Valid move for the current player, as produced by generate_moves
+        :returns UndoRecord: Record of the changes made by the move
+        """
+        geometry = self._geometry
+        from_sq = geometry.square(move[0])
+        piece_hash = self._piece_hash
+        captured = captured_kings = 0
+        promoted = False
+        sq = from_sq
+        for loc in move[1:]:
+            to_sq = geometry.square(loc)
+            hop_captured, hop_captured_kings, hop_promoted = self._move_piece(sq, to_sq)
+            captured |= hop_captured
+            captured_kings |= hop_captured_kings
+            promoted = promoted or hop_promoted
+            sq = to_sq
+        record = UndoRecord(from_sq, sq, captured, captured_kings, promoted, self._end_game_move_count, piece_hash,
+                            (self._legal_key, self._legal_moves, self._legal_move_set))
+        if captured:
+            if self.current_player == 'w':
+                self._black_count -= bin(captured).count('1')
             else:
-                self._end_game_move_count += 1
+                self._white_count -= bin(captured).count('1')
+        self.current_player = 'w' if self.current_player == 'b' else 'b'
+        if captured or promoted:
+            self._end_game_move_count = 0
         else:
-            # If full move was invalid, restore board to state prior to executing any moves
-            self._board = temp_board
-        # TODO: Log each move
-        return valid_move
+            self._end_game_move_count += 1
+        return record
+
+    def undo_move(self, record):
+        """Reverts a move executed by apply_move.
+
+        :param record: UndoRecord returned by apply_move for the last move applied to this board
+        """
+        self.current_player = 'w' if self.current_player == 'b' else 'b'
+        moved = (1 << record.from_sq) ^ (1 << record.to_sq)
+        if self.current_player == 'w':
+            self._white ^= moved
+            self._black |= record.captured
+            if record.captured:
+                self._black_count += bin(record.captured).count('1')
+        else:
+            self._black ^= moved
+            self._white |= record.captured
+            if record.captured:
+                self._white_count += bin(record.captured).count('1')
+        if record.promoted:
+            self._kings &= ~(1 << record.to_sq)
+        elif self._kings >> record.to_sq & 1:
+            self._kings ^= moved
+        self._kings |= record.captured_kings
+        self._end_game_move_count = record.end_game_move_count
+        self._piece_hash = record.piece_hash
+        self._legal_key, self._legal_moves, self._legal_move_set = record.legal_cache
+        self._rows = None
+
+    def _move_piece(self, from_sq, to_sq):
+        """Moves the piece at from_sq to to_sq, removing the piece jumped over and promoting it on the last row.
+
+        :returns tuple: (captured square bit or 0, captured king bit or 0, whether the piece was promoted)
+        """
+        from_bit, to_bit = 1 << from_sq, 1 << to_sq
+        keys = self._geometry.zobrist_pieces
+        if self._white & from_bit:
+            self._white ^= from_bit | to_bit
+            color, opponent_color = 'w', 'b'
+        else:
+            self._black ^= from_bit | to_bit
+            color, opponent_color = 'b', 'w'
+        promoted = False
+        if self._kings & from_bit:
+            self._kings ^= from_bit | to_bit
+            piece = new_piece = color.upper()
+        elif to_bit & self._geometry.promotion_rows[color]:
+            # A pawn is promoted when it reaches the last row
+            self._kings |= to_bit
+            promoted = True
+            piece, new_piece = color, color.upper()
+        else:
+            piece = new_piece = color
+        self._piece_hash ^= keys[piece][from_sq] ^ keys[new_piece][to_sq]
+        # A piece is removed if jumped over
+        captured = captured_king = 0
+        n = self._board_size
+        if abs(to_sq // n - from_sq // n) == 2:
+            captured_sq = (from_sq + to_sq) // 2
+            captured = 1 << captured_sq
+            captured_king = self._kings & captured
+            self._piece_hash ^= keys[opponent_color.upper() if captured_king else opponent_color][captured_sq]
+            self._white &= ~captured
+            self._black &= ~captured
+            self._kings &= ~captured
+        self._rows = None
+        return captured, captured_king, promoted
 
     def _validate_move(self, move):
-        """Determines whether the move *to* location is a valid end position for piece in *from* location.
+        """Determines whether move is one of the legal moves of the current player.
 
-        This method generates all valid moves for the starting location in move, and then checks whether the move is in
-        this set. It also checks that the piece at the starting location belongs to the current player.
+        The move is looked up in the set of moves returned by legal_moves, so forced capture and multiple jumps are
+        checked once for the whole move rather than for each step.
 
-        :param move: Move to validate. Tuple in form ((x1,y1),(x2,y2))
+        :param move: Move to validate, eg, [(x1,y1),(x2,y2)]
         :returns bool: true if move is valid, false otherwise
         """
-        if self.current_player == self._board[move[0][0]][move[0][1]].lower():
-            is_jump, available_moves = self.generate_moves(move[0])
-            if not is_jump:
-                # If this piece does not have any jumps, check if any other pieces have jumps (forced capture rule)
-                pieces = self.get_locations_by_color(self.current_player)
-                for piece in pieces:
-                    is_jump, _ = self.generate_moves(piece)
-                    if is_jump:
-                        return False
-            return move in available_moves
-        else:
+        try:
+            key = tuple(tuple(loc) for loc in move)
+        except TypeError:
             return False
+        if self._legal_move_set is None or self._legal_key != self._position_key():
+            self._legal_move_set = {tuple(legal_move) for legal_move in self.legal_moves()}
+        return key in self._legal_move_set
+
+    def legal_moves(self):
+        """Generates the list of valid moves for the current player.
+
+        Moves are generated for all pieces in a single pass, taking into account forced capture: if any piece can
+        jump, only jumps are returned. The list is cached until the position changes, and must not be modified.
+
+        :returns list: List of moves, each a list of location tuples as returned by generate_moves
+        """
+        key = self._position_key()
+        if self._legal_key == key:
+            return self._legal_moves
+        geometry = self._geometry
+        player = self.current_player
+        own = self._own_pieces(player)
+        empty = geometry.playable & ~(self._white | self._black)
+        is_jump = self._has_jump(player)
+        # Bit-parallel filter of the pieces with at least one move, so generate_moves is only run for those
+        candidates = 0
+        for d, movers in enumerate(self._movers(player)):
+            shift = geometry.shifts[d]
+            if is_jump:
+                opponent = self._black if player == 'w' else self._white
+                targets = _shift(_shift(movers & geometry.jump_sources[d], shift) & opponent, shift) & empty
+                candidates |= _shift(targets, -2 * shift)
+            else:
+                candidates |= _shift(_shift(movers & geometry.step_sources[d], shift) & empty, -shift)
+        moves = []
+        for sq in _iter_squares(own & candidates, reverse=player == 'b'):
+            moves.extend(self.generate_moves(geometry.locations[sq])[1])
+        self._legal_key = key
+        self._legal_moves = moves
+        self._legal_move_set = None
+        return moves
+
+    def _position_key(self):
+        return self._white, self._black, self._kings, self.current_player
 
     def get_winner(self):
         """Checks for end game status and returns winner.
 
+        Whether the current player can move is checked for all pieces at once without generating the moves, and the
+        piece counts compared after END_GAME_MOVE_LIMIT moves are kept up to date as moves are made, so this takes
+        constant time.
+
         :returns str: 'w' if white wins, 'b' if black wins, 'd' if draw, None otherwise
         """
-        pieces = self.get_locations_by_color(self.current_player)
-        move_count = sum([len(self.generate_moves(piece)[1]) for piece in pieces])
-        if move_count == 0:
-            return 'b' if self.current_player == 'w' else 'w'
-        if self._end_game_move_count == 40:
-            opponent_player = 'w' if self.current_player == 'b' else 'w'
-            opponent_pieces = self.get_locations_by_color(opponent_player)
-            if len(pieces) > len(opponent_pieces):
+        opponent_player = 'b' if self.current_player == 'w' else 'w'
+        if not self._has_moves(self.current_player):
+            return opponent_player
+        if self._end_game_move_count == END_GAME_MOVE_LIMIT:
+            piece_count = self._white_count if self.current_player == 'w' else self._black_count
+            opponent_count = self._black_count if self.current_player == 'w' else self._white_count
+            if piece_count > opponent_count:
                 return self.current_player
-            elif len(opponent_pieces) > len(pieces):
+            elif opponent_count > piece_count:
                 return opponent_player
             else:
                 return 'd'
         return None
 
+    def zobrist_hash(self):
+        """Returns a 64 bit Zobrist hash identifying the position.
+
+        The hash covers the pieces and kings on the board, the player to move and the end game counter in buckets of
+        END_GAME_BUCKET_SIZE moves. It is updated incrementally as moves are made, and is identical across processes
+        for the same board size.
+
+        :returns int: Hash of the position
+        """
+        geometry = self._geometry
+        key = self._piece_hash ^ geometry.zobrist_end_game[min(self._end_game_move_count, END_GAME_MOVE_LIMIT) //
+                                                           END_GAME_BUCKET_SIZE]
+        return key ^ geometry.zobrist_black_to_move if self.current_player == 'b' else key
+
+    def _compute_piece_hash(self):
+        keys = self._geometry.zobrist_pieces
+        piece_hash = 0
+        for sq in _iter_squares(self._white | self._black):
+            piece_hash ^= keys[self._square_char(sq)][sq]
+        return piece_hash
+
+    def _own_pieces(self, w_or_b):
+        return self._white if w_or_b == 'w' else self._black
+
+    def _movers(self, w_or_b):
+        """Returns the pieces of w_or_b able to move in each direction, in BoardGeometry.DIRECTIONS order."""
+        own = self._own_pieces(w_or_b)
+        kings = own & self._kings
+        return (own, own, kings, kings) if w_or_b == 'w' else (kings, kings, own, own)
+
+    def _has_moves(self, w_or_b):
+        """Checks, for all pieces of w_or_b at once, whether any move is available."""
+        geometry = self._geometry
+        empty = geometry.playable & ~(self._white | self._black)
+        for d, movers in enumerate(self._movers(w_or_b)):
+            if _shift(movers & geometry.step_sources[d], geometry.shifts[d]) & empty:
+                return True
+        return self._has_jump(w_or_b)
+
+    def _has_jump(self, w_or_b):
+        """Checks, for all pieces of w_or_b at once, whether any capture is available."""
+        geometry = self._geometry
+        opponent = self._black if w_or_b == 'w' else self._white
+        empty = geometry.playable & ~(self._white | self._black)
+        for d, movers in enumerate(self._movers(w_or_b)):
+            shift = geometry.shifts[d]
+            if _shift(_shift(movers & geometry.jump_sources[d], shift) & opponent, shift) & empty:
+                return True
+        return False
+
     def generate_moves(self, loc, start_board=None):
         """Generates list of valid moves for the piece at loc.
 
@@ -154,54 +519,84 @@ class CheckerBoard:
         is a board is only provided when this is called recursively, checking for multiple jumps.
 
         :param loc: Location of piece to check
-        :param start_board: Board to generate moves for. If not provided, current board state is used.
+        :param start_board: Board to generate moves for, as a (white, black, kings) tuple of bitboards. If not
+        provided, current board state is used.
         :return tuple: First element is boolean indicating whether the moves are jumps or not. Second element is a list
         of location tuples which the piece at loc can move to.
         """
         jumps_only = True
         if start_board is None:
-            start_board = self._board
+            start_board = (self._white, self._black, self._kings)
             jumps_only = False
+        white, black, kings = start_board
+        geometry = self._geometry
+        loc = tuple(loc)
+        sq = geometry.square(loc)
+        if white >> sq & 1:
+            opponent, forward = black, (0, 1)
+        elif black >> sq & 1:
+            opponent, forward = white, (2, 3)
+        else:
+            return (True, []) if jumps_only else (False, [])
+        is_king = kings >> sq & 1
+        empty = geometry.playable & ~(white | black)
         moves = []
         jumps = []
-        move_piece = start_board[loc[0]][loc[1]].lower()
-        for step in self._generate_steps(loc, start_board):
-            board = copy.deepcopy(start_board)  # create copy to test jumps on
-            x, y = loc[0] + step[0], loc[1] + step[1]
-            if 0 <= x < self._board_size and 0 <= y < self._board_size:
-                if isinstance(board[x][y], str) and board[x][y].lower() == ('w' if move_piece == 'b' else 'b'):
-                    xp, yp = x + step[0], y + step[1]
-                    if (0 <= xp < self._board_size and 0 <= yp < self._board_size and
-                            board[xp][yp] == 0):
-                        # Move starting piece to end location
-                        board[xp][yp] = board[loc[0]][loc[1]]
-                        # Set starting and jumped piece to empty
-                        board[loc[0]][loc[1]] = board[x][y] = 0
-                        # A pawn is promoted when it reaches the last row
-                        if (xp == self._board_size - 1 and move_piece == 'w') or (xp == 0 and move_piece == 'b'):
-                            board[xp][yp] = board[xp][yp].upper()
-
-                        jumps.append([loc, (xp, yp)])
-                        jumps.extend([[loc] + jump_extension
-                                      for jump_extension in self.generate_moves((xp, yp), board)[1]])
-                elif board[x][y] == 0 and not jumps_only:
-                    moves.append([loc, (x, y)])
+        for d, step_sq, jump_sq in geometry.neighbors[sq]:
+            if not is_king and d not in forward:
+                continue
+            if opponent >> step_sq & 1:
+                if jump_sq >= 0 and empty >> jump_sq & 1:
+                    jump_loc = geometry.locations[jump_sq]
+                    jumps.append([loc, jump_loc])
+                    jumps.extend([[loc] + jump_extension
+                                  for jump_extension in self.generate_moves(
+                                      jump_loc, self._jumped_board(start_board, sq, step_sq, jump_sq))[1]])
+            elif not jumps_only and empty >> step_sq & 1:
+                moves.append([loc, geometry.locations[step_sq]])
         return (True, jumps) if len(jumps) or jumps_only > 0 else (False, moves)
 
-    @staticmethod
-    def _generate_steps(loc, board):
-        char = board[loc[0]][loc[1]]
-        white_steps = [(1, -1), (1, 1)]
-        black_steps = [(-1, -1), (-1, 1)]
-        steps = []
-        if char != 'b':
-            steps.extend(white_steps)
-        if char != 'w':
-            steps.extend(black_steps)
-        return steps
+    def _jumped_board(self, board, from_sq, over_sq, to_sq):
+        """Returns the (white, black, kings) bitboards after the piece at from_sq jumps over over_sq to to_sq."""
+        white, black, kings = board
+        from_bit, over_bit, to_bit = 1 << from_sq, 1 << over_sq, 1 << to_sq
+        if white & from_bit:
+            white ^= from_bit | to_bit
+            black &= ~over_bit
+            promotion_row = self._geometry.promotion_rows['w']
+        else:
+            black ^= from_bit | to_bit
+            white &= ~over_bit
+            promotion_row = self._geometry.promotion_rows['b']
+        if kings & from_bit:
+            kings ^= from_bit | to_bit
+        elif to_bit & promotion_row:
+            # A pawn is promoted when it reaches the last row
+            kings |= to_bit
+        return white, black, kings & ~over_bit
+
+    def _square_char(self, sq):
+        bit = 1 << sq
+        if self._white & bit:
+            return 'W' if self._kings & bit else 'w'
+        if self._black & bit:
+            return 'B' if self._kings & bit else 'b'
+        return 0 if self._geometry.playable & bit else '_'
+
+    def _get_rows(self):
+        if self._rows is None:
+            n = self._board_size
+            self._rows = [[self._square_char(r * n + c) for c in range(n)] for r in range(n)]
+        return self._rows
 
     def __getitem__(self, item):
-        return self._board[item]
+        """Read-only compatibility view of the board as rows of 'b', 'B', 'w', 'W', 0, or '_' characters.
+
+        These represent a black pawn, black king, white pawn, white king, empty space, or invalid space. The rows are
+        rebuilt lazily from the bitboards after a position change, so changes made to them are not reflected on the
+        board.
+        """
+        return self._get_rows()[item]
 
     def get_pieces(self):
         """Gets a list of all player pieces on the board.
@@ -209,10 +604,8 @@ class CheckerBoard:
         :returns list: List of tuples where first element is the piece ('w', 'W', 'b', or 'B'), and the second element
         is the location tuple.
         """
-        return [(i, (ix, iy))
-                for ix, row in enumerate(self._board)
-                for iy, i in enumerate(row)
-                if isinstance(i, str) and i.isalpha()]
+        return [(self._square_char(sq), self._geometry.locations[sq])
+                for sq in _iter_squares(self._white | self._black)]
 
     def get_locations_by_color(self, w_or_b):
         """Gets a list of piece locations for the specified players.
@@ -220,21 +613,156 @@ class CheckerBoard:
         :param w_or_b: 'w' for white player pieces, 'b' for black player pieces. Other values invalid.
         :returns list: List of location tuples
         """
-        locs = [(ix, iy)
-                for ix, row in enumerate(self._board)
-                for iy, i in enumerate(row)
-                if isinstance(i, str) and i.lower() == w_or_b]
-        if w_or_b == 'b':
-            return locs[::-1]
-        else:
-            return locs
+        if w_or_b not in ('w', 'b'):
+            return []
+        return [self._geometry.locations[sq]
+                for sq in _iter_squares(self._own_pieces(w_or_b), reverse=w_or_b == 'b')]
+
+    def get_bitboards(self):
+        """Returns the position as bitboards of white pieces, black pieces and kings of either color.
+
+        Bit row * board_size + col of each bitboard represents a square, see BoardGeometry.
+
+        :returns tuple: (white, black, kings) integers
+        """
+        return self._white, self._black, self._kings
+
+    def get_end_game_moves_left(self):
+        """Returns the number of moves which can be made before the game is decided by piece count.
+
+        The count restarts at END_GAME_MOVE_LIMIT after every capture or promotion to king.
+        """
+        return END_GAME_MOVE_LIMIT - self._end_game_move_count
+
+    def count_pieces(self, w_or_b):
+        """Counts the pieces of the specified player.
+
+        :param w_or_b: 'w' for white player pieces, 'b' for black player pieces.
+        :returns tuple: Number of pawns and number of kings
+        """
+        kings = bin(self._own_pieces(w_or_b) & self._kings).count('1')
+        return (self._white_count if w_or_b == 'w' else self._black_count) - kings, kings
+
+
+class BoardSnapshot:
+    """An immutable, hashable position, which is what players are handed each turn.
+
+    A snapshot only holds the bitboards, the player to move and the end game counter, so creating one and passing it
+    to another thread takes constant time and nothing needs to be copied. Snapshots of equal positions are equal and
+    hash the same, so they can be used directly as dict keys. The read-only queries of CheckerBoard are available, and
+    are answered by a private CheckerBoard created on the first query. Use to_board (or copy) to get a CheckerBoard
+    which can be modified, or child to derive the snapshot after a move. Copying a snapshot, even with deepcopy,
+    returns the snapshot itself.
+    """
+    __slots__ = ('board_size', 'white', 'black', 'kings', 'current_player', 'end_game_move_count', '_key', '_board')
+
+    def __init__(self, board_size, white, black, kings, current_player='w', end_game_move_count=0):
+        """Inits a BoardSnapshot with the specified parameters, see CheckerBoard.from_bitboards."""
+        for name, value in (('board_size', board_size), ('white', white), ('black', black), ('kings', kings),
+                            ('current_player', current_player), ('end_game_move_count', end_game_move_count),
+                            ('_key', (board_size, white, black, kings, current_player, end_game_move_count)),
+                            ('_board', None)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('BoardSnapshot is immutable')
+
+    def __eq__(self, other):
+        return isinstance(other, BoardSnapshot) and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __repr__(self):
+        return 'BoardSnapshot{}'.format(self._key)
+
+    def __reduce__(self):
+        # Slots can not be restored through __setattr__, and the private CheckerBoard is not worth sending
+        return BoardSnapshot, self._key
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _get_board(self):
+        if self._board is None:
+            object.__setattr__(self, '_board', CheckerBoard.from_snapshot(self))
+        return self._board
+
+    def to_board(self):
+        """Returns a new CheckerBoard with this position, which can be modified."""
+        return CheckerBoard.from_snapshot(self)
+
+    def copy(self):
+        """Returns a new CheckerBoard with this position, as CheckerBoard.copy does."""
+        return self.to_board()
+
+    def child(self, move):
+        """Returns the snapshot of the position after a valid move, see CheckerBoard.apply_move."""
+        board = self._get_board().copy()
+        board.apply_move(move)
+        return board.snapshot()
+
+    def legal_moves(self):
+        """See CheckerBoard.legal_moves."""
+        return self._get_board().legal_moves()
+
+    def generate_moves(self, loc):
+        """See CheckerBoard.generate_moves."""
+        return self._get_board().generate_moves(loc)
+
+    def get_winner(self):
+        """See CheckerBoard.get_winner."""
+        return self._get_board().get_winner()
+
+    def zobrist_hash(self):
+        """See CheckerBoard.zobrist_hash."""
+        return self._get_board().zobrist_hash()
+
+    def serialize(self):
+        """See CheckerBoard.serialize."""
+        return self._get_board().serialize()
+
+    def get_pieces(self):
+        """See CheckerBoard.get_pieces."""
+        return self._get_board().get_pieces()
+
+    def get_locations_by_color(self, w_or_b):
+        """See CheckerBoard.get_locations_by_color."""
+        return self._get_board().get_locations_by_color(w_or_b)
+
+    def get_bitboards(self):
+        """See CheckerBoard.get_bitboards."""
+        return self.white, self.black, self.kings
+
+    def get_end_game_moves_left(self):
+        """See CheckerBoard.get_end_game_moves_left."""
+        return END_GAME_MOVE_LIMIT - self.end_game_move_count
+
+    def count_pieces(self, w_or_b):
+        """See CheckerBoard.count_pieces."""
+        return self._get_board().count_pieces(w_or_b)
+
+    def print(self):
+        """See CheckerBoard.print."""
+        self._get_board().print()
+
+    def __getitem__(self, item):
+        """See CheckerBoard.__getitem__."""
+        return self._get_board()[item]
 
 
 def main():
+    # Imported here since game_log imports this module
+    from game_log import GameRecorder, GameWriter
     time_limit = 1
     board_size = 8
+    log_path = 'games.ckl'  # File the game is appended to, see game_log
     cb = CheckerBoard(board_size)
     players = [('w', SimpleAI(board_size, 1)), ('b', ConsolePlayer(board_size, 2))]
+    recorder = GameRecorder(board_size)
     move_ind = 0
     # Until end game conditions met
     while not cb.get_winner():
@@ -243,28 +771,24 @@ def main():
         cb.print()
         # Start a new thread to wait for Player move
         ret_val = []  # list representing move returned from player
-        t = Thread(target=player.move, args=(copy.deepcopy(cb), time_limit, ret_val))
+        start_time = time.monotonic()
+        t = Thread(target=player.move, args=(cb.snapshot(), time_limit, ret_val))
         t.start()
         t.join(time_limit)
-        if not cb.execute_move(ret_val):
+        move_time = time.monotonic() - start_time
+        move = list(ret_val)
+        if not cb.execute_move(move):
             print('Invalid move {} by player {}'
-                  .format(ret_val, player.get_name()))
+                  .format(move, player.get_name()))
             # Choose random valid move, taking into account forced capture
-            pieces = cb.get_locations_by_color(player_piece)
-            moves = []
-            jumps = []
-            for piece in pieces:
-                is_jump, piece_moves = cb.generate_moves(piece)
-                if is_jump:
-                    jumps.extend(piece_moves)
-                else:
-                    moves.extend(piece_moves)
-            move = choice(jumps) if len(jumps) > 0 else choice(moves)
+            move = choice(cb.legal_moves())
             cb.execute_move(move)
             print('Playing random move instead: {}'.format(move))
+        recorder.add_move(move, move_time)
         move_ind += 1
-        # TODO: Log and winner
     cb.print()
+    with GameWriter(log_path) as writer:
+        writer.write(recorder.finish(cb.get_winner()))
     print("The winner is {}!".format(players[0 if cb.get_winner() == 'w' else 1][1].get_name()))
 
 
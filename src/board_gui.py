@@ -1,11 +1,26 @@
+"""Graphical display of games with pygame.
+
+CheckerBoardGUI plays a game between two players and shows it in a window. The referee runs in its own thread and
+hands each position to the display loop through a queue, so the game is never slowed down by drawing: when moves come
+faster than the frame rate, the display skips to the latest position. BoardRenderer only redraws the squares which
+changed since the last position it drew, blitting piece surfaces rendered once per square size.
+
+Games can also be rendered without a window, to numbered PNG frames: a live game with
+CheckerBoardGUI(..., headless=True, frame_dir='frames'), or a recorded game with render_replay. From the src
+directory, to render the first game of a game log:
+
+    python board_gui.py --replay games.ckl --game 0 --frames frames
+"""
 from board import CheckerBoard
+from game_log import GameArchive
 from players.interface import AbstractPlayer
 from players.simple_ai import SimpleAI
-from threading import Thread
-import copy
+from threading import Event, Thread
 from random import choice
+import argparse
+import os
 import pygame
-import time
+import queue
 
 
 BLACK = (0, 0, 0)
@@ -13,15 +28,121 @@ WHITE = (255, 255, 255)
 GREEN = (0, 128, 0)
 CREAM = (255, 245, 180)
 
+_piece_surfaces = {}  # Pre-rendered pieces by square size
+
+
+def get_piece_surfaces(square_size):
+    """Returns the surfaces of the pieces drawn on squares of square_size pixels, keyed by 'w', 'W', 'b' and 'B'.
+
+    The surfaces are rendered on the first call for each square size and reused afterwards.
+    """
+    if square_size not in _piece_surfaces:
+        if not pygame.font.get_init():
+            pygame.font.init()
+        font = pygame.font.Font(None, max(square_size * 28 // 60, 8))
+        surfaces = {}
+        for piece, color, text_color in (('w', WHITE, BLACK), ('b', BLACK, WHITE)):
+            surface = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+            pygame.draw.circle(surface, color, (square_size // 2, square_size // 2), square_size // 4)
+            surfaces[piece] = surface
+            # Kings have a 'K' in the middle of the piece
+            king_surface = surface.copy()
+            text = font.render('K', True, text_color)
+            king_surface.blit(text, ((square_size - text.get_width()) // 2, (square_size - text.get_height()) // 2))
+            surfaces[piece.upper()] = king_surface
+        _piece_surfaces[square_size] = surfaces
+    return _piece_surfaces[square_size]
+
+
+class BoardRenderer:
+    """A BoardRenderer draws positions on a surface, redrawing only the squares which changed since the last draw."""
+    def __init__(self, board_size, surface):
+        """Inits a BoardRenderer with the specified parameters.
+
+        :param board_size: The number of squares wide each side of the board is.
+        :param surface: pygame Surface to draw on, such as the display surface or an offscreen Surface
+        """
+        self._board_size = board_size
+        self.surface = surface
+        self._square_size = min(surface.get_size()) // board_size
+        self._pieces = None  # Piece on each occupied location, as last drawn
+
+    def invalidate(self):
+        """Makes the next draw redraw the whole board, eg, after the window was covered."""
+        self._pieces = None
+
+    def draw(self, board):
+        """Draws a position.
+
+        :param board: CheckerBoard or BoardSnapshot to draw
+        :returns list: pygame Rects of the parts of the surface which were redrawn
+        """
+        pieces = {loc: piece for piece, loc in board.get_pieces()}
+        if self._pieces is None:
+            for row in range(self._board_size):
+                for col in range(self._board_size):
+                    self._draw_square((row, col), pieces.get((row, col)))
+            self._pieces = pieces
+            size = self._square_size * self._board_size
+            return [pygame.Rect(0, 0, size, size)]
+        rects = []
+        for loc in set(pieces).union(self._pieces):
+            if pieces.get(loc) != self._pieces.get(loc):
+                rects.append(self._draw_square(loc, pieces.get(loc)))
+        self._pieces = pieces
+        return rects
+
+    def _draw_square(self, loc, piece):
+        row, col = loc
+        rect = pygame.Rect(col * self._square_size, row * self._square_size, self._square_size, self._square_size)
+        self.surface.fill(CREAM if (col + (row % 2)) % 2 == 0 else GREEN, rect)
+        if piece is not None:
+            self.surface.blit(get_piece_surfaces(self._square_size)[piece], rect)
+        return rect
+
+    def save(self, path):
+        """Saves the surface as an image, in a format chosen by the extension of path, eg, PNG."""
+        pygame.image.save(self.surface, path)
+
+
+def _frame_path(frame_dir, index):
+    return os.path.join(frame_dir, 'frame{:05d}.png'.format(index))
+
+
+def render_replay(record, frame_dir, square_size=60):
+    """Renders the position before each move of a recorded game and the final position to PNG files, without a window.
+
+    :param record: GameRecord of the game
+    :param frame_dir: Directory the frames are written to, as frame00000.png, frame00001.png, ... It is created if it
+    does not exist.
+    :param square_size: Size of a square in pixels
+    :returns int: Number of frames written
+    """
+    os.makedirs(frame_dir, exist_ok=True)
+    board = CheckerBoard(record.board_size)
+    renderer = BoardRenderer(record.board_size, pygame.Surface((square_size * record.board_size,) * 2))
+    frames = 0
+    for move, _ in record.moves():
+        renderer.draw(board)
+        renderer.save(_frame_path(frame_dir, frames))
+        frames += 1
+        board.apply_move(move)
+    renderer.draw(board)
+    renderer.save(_frame_path(frame_dir, frames))
+    return frames + 1
+
 
 class CheckerBoardGUI:
-    def __init__(self, board_size, time_limit, player1, player2):
+    def __init__(self, board_size, time_limit, player1, player2, fps=30, frame_dir=None, headless=False):
         """ Inits a CheckerBoardGUI with the specified parameters.
 
         :param board_size: Size of the square board to be used. Must be even and >= 4.
         :param time_limit: Time in seconds each player has to act
         :param player1: Class to initialize first player from.
         :param player2: Class to initialize second player from.
+        :param fps: Maximum number of times per second the window is redrawn
+        :param frame_dir: Directory to save every position of the game to as numbered PNG files, if provided
+        :param headless: Whether to draw offscreen instead of opening a window, eg, to only save frames
         :raises TypeError: if player1 or player2 not subclass of AbstractPlayer
         :raises ValueError: if board_size is not an even number or less than 4
         """
@@ -36,6 +157,9 @@ class CheckerBoardGUI:
 
         self._board_size = board_size
         self._time_limit = time_limit
+        self._fps = fps
+        self._frame_dir = frame_dir
+        self._headless = headless
         self._cb = CheckerBoard(self._board_size)
 
         self._players = [('w', player1(self._board_size, 1)), ('b', player2(self._board_size, 2))]
@@ -43,74 +167,107 @@ class CheckerBoardGUI:
         self._setup_window()
 
     def play(self):
-        move_ind = 0
-        # Loop until end game conditions met
-        while not self._cb.get_winner():
-            self._update()
-            player_piece, player = self._players[move_ind % 2]
-            # Start a new thread to wait for Player move
-            ret_val = []  # list representing move returned from player
-            t = Thread(target=player.move, args=(copy.deepcopy(self._cb), self._time_limit, ret_val))
-            t.start()
-            end_time = time.monotonic() + self._time_limit
-            while t.isAlive() and time.monotonic() < end_time:
+        """Plays the game until it ends or the window is closed.
+
+        :returns str: 'w' if white won, 'b' if black won, 'd' for a draw, None if the window was closed first
+        """
+        positions = queue.Queue()
+        stop = Event()
+        positions.put(self._cb.snapshot())
+        referee = Thread(target=self._referee, args=(positions, stop), daemon=True)
+        referee.start()
+        clock = pygame.time.Clock()
+        frames = 0
+        while True:
+            if not self._headless:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
-                        return
-                time.sleep(0.05)
-            t.join(self._time_limit)
-            if not self._cb.execute_move(ret_val):
-                print('Invalid move {} by player {}'
-                      .format(ret_val, player.get_name()))
-                # Choose random valid move, taking into account forced capture
-                pieces = self._cb.get_locations_by_color(player_piece)
-                moves = []
-                jumps = []
-                for piece in pieces:
-                    is_jump, piece_moves = self._cb.generate_moves(piece)
-                    if is_jump:
-                        jumps.extend(piece_moves)
-                    else:
-                        moves.extend(piece_moves)
-                move = choice(jumps) if len(jumps) > 0 else choice(moves)
-                self._cb.execute_move(move)
-                print('Playing random move instead: {}'.format(move))
-            move_ind += 1
+                        stop.set()
+                        return None
+                    elif event.type == pygame.WINDOWEXPOSED:
+                        self._renderer.invalidate()
+            # Without a window there are no events to handle, so block until the next position. With a window, wait at
+            # most one frame so events keep being handled while a player is thinking. Saved frames are not lost
+            # either way, since every queued position is drawn and saved below.
+            try:
+                batch = [positions.get(timeout=None if self._headless else 1 / self._fps)]
+            except queue.Empty:
+                batch = []
+            while not positions.empty():
+                batch.append(positions.get())
+            game_over = len(batch) > 0 and batch[-1] is None
+            batch = [board for board in batch if board is not None]
+            if self._frame_dir is None:
+                # Skip to the latest position
+                batch = batch[-1:]
+            rects = []
+            for board in batch:
+                rects.extend(self._renderer.draw(board))
+                if self._frame_dir is not None:
+                    self._renderer.save(_frame_path(self._frame_dir, frames))
+                    frames += 1
+            if rects and not self._headless:
+                pygame.display.update(rects)
+            if game_over:
+                return self._cb.get_winner()
+            if not self._headless:
+                clock.tick(self._fps)
+
+    def _referee(self, positions, stop):
+        """Runs the game, putting a BoardSnapshot in positions after each move and None when the game is over."""
+        try:
+            move_ind = 0
+            # Loop until end game conditions met
+            while not self._cb.get_winner() and not stop.is_set():
+                player_piece, player = self._players[move_ind % 2]
+                # Start a new thread to wait for Player move
+                ret_val = []  # list representing move returned from player
+                t = Thread(target=player.move, args=(self._cb.snapshot(), self._time_limit, ret_val), daemon=True)
+                t.start()
+                t.join(self._time_limit)
+                move = list(ret_val)
+                if not self._cb.execute_move(move):
+                    print('Invalid move {} by player {}'
+                          .format(move, player.get_name()))
+                    # Choose random valid move, taking into account forced capture
+                    move = choice(self._cb.legal_moves())
+                    self._cb.execute_move(move)
+                    print('Playing random move instead: {}'.format(move))
+                positions.put(self._cb.snapshot())
+                move_ind += 1
+        finally:
+            positions.put(None)
 
     def _setup_window(self):
-        pygame.init()
         window_size = 600
         self._square_size = window_size // self._board_size
-        self._screen = pygame.display.set_mode((window_size, window_size))
-        font = pygame.font.Font(None, 28)
-        self._white_king_text = font.render('K', True, BLACK)
-        self._black_king_text = font.render('K', True, WHITE)
-
-    def _update(self):
-        # Draw board background
-        for row in range(self._board_size):
-            for col in range(self._board_size):
-                color = CREAM if (col + (row % 2)) % 2 == 0 else GREEN
-                self._screen.fill(color, pygame.Rect(col * self._square_size,
-                                                     row * self._square_size,
-                                                     self._square_size, self._square_size))
-
-        # Draw pieces
-        for piece in self._cb.get_pieces():
-            color = WHITE if piece[0].lower() == 'w' else BLACK
-            x = piece[1][1] * self._square_size + self._square_size // 2
-            y = piece[1][0] * self._square_size + self._square_size // 2
-            pygame.draw.circle(self._screen, color, (x, y), self._square_size // 4)
-            # If king, draw 'K' in the middle of piece
-            if piece[0].isupper():
-                self._screen.blit(self._white_king_text if piece[0].lower() == 'w' else self._black_king_text,
-                                  (x - self._white_king_text.get_width() // 2,
-                                   y - self._white_king_text.get_height() // 2))
-
-        pygame.display.update()
+        if self._headless:
+            screen = pygame.Surface((self._square_size * self._board_size,) * 2)
+        else:
+            pygame.init()
+            screen = pygame.display.set_mode((window_size, window_size))
+        if self._frame_dir is not None:
+            os.makedirs(self._frame_dir, exist_ok=True)
+        self._renderer = BoardRenderer(self._board_size, screen)
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Watch a game, or render a recorded game to image frames.')
+    parser.add_argument('--replay', help='game log file to render a game from, without opening a window')
+    parser.add_argument('--game', type=int, default=0, help='index of the game to render in the game log')
+    parser.add_argument('--frames', default='frames', help='directory to write the frames of a replay to')
+    parser.add_argument('--square-size', type=int, default=60, help='size of a square of a replay in pixels')
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        with GameArchive(args.replay) as archive:
+            for index, record in enumerate(archive):
+                if index == args.game:
+                    print('Wrote {} frames to {}'.format(render_replay(record, args.frames, args.square_size),
+                                                         args.frames))
+                    return
+        print('The game log has no game {}'.format(args.game))
+        return
     cb_gui = CheckerBoardGUI(10, 1, SimpleAI, SimpleAI)
     cb_gui.play()
 
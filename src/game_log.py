@@ -0,0 +1,207 @@
+"""Compact binary game records.
+
+A game log file starts with an 8 byte header (the magic bytes b'CKLG', a format version and padding) followed by
+game records, appended one after another as games finish. Each game record is:
+
+* a 16 byte header: record length in bytes excluding the length field (uint32), board size (uint8), result (uint8: 0
+  unfinished, 1 white wins, 2 black wins, 3 draw), white and black player ids (uint32 each) and number of moves (uint16)
+* for each move: the number of steps (uint8), the squares visited by the piece including its start (one uint8 per
+  square, see square_index), and the time the player took in milliseconds (uint16, saturated at 65535)
+
+All values are little endian. A simple move takes 5 bytes. Records are written in one piece when a game finishes, so
+an interrupted writer never leaves a partial game in the file. GameArchive memory-maps a log file and decodes games
+and moves only when they are iterated, so very large archives can be scanned without loading them.
+"""
+from board import CheckerBoard
+import mmap
+import os
+import struct
+
+
+MAGIC = b'CKLG'
+VERSION = 1
+_FILE_HEADER = struct.Struct('<4sB3x')
+_GAME_HEADER = struct.Struct('<IBBIIH')
+_MOVE_TIME = struct.Struct('<H')
+
+RESULT_CODES = {None: 0, 'w': 1, 'b': 2, 'd': 3}
+RESULTS = {code: result for result, code in RESULT_CODES.items()}
+
+
+def square_index(loc, board_size):
+    """Returns the index of a playable square, counting only the playable squares row by row.
+
+    Only one of every two squares of a row is playable, so the index of (row, col) is (row * board_size + col) // 2.
+    Board sizes up to 22 fit in one byte.
+    """
+    return (loc[0] * board_size + loc[1]) // 2
+
+
+def square_location(index, board_size):
+    """Returns the (row, col) location of a playable square index, see square_index."""
+    row, half_col = divmod(index, board_size // 2)
+    return row, 2 * half_col + (1 - row % 2)
+
+
+class GameRecorder:
+    """A GameRecorder packs the moves of one game as they are played."""
+    def __init__(self, board_size, white_id=0, black_id=0):
+        """Inits a GameRecorder with the specified parameters.
+
+        :param board_size: Size of the board the game is played on. At most 22.
+        :param white_id: Id of the white player, an integer which fits in 32 bits
+        :param black_id: Id of the black player, an integer which fits in 32 bits
+        :raises ValueError: if the board is too large for one byte square indices
+        """
+        if board_size * board_size // 2 > 256:
+            raise ValueError('Board size {} is too large for game records'.format(board_size))
+        self._board_size = board_size
+        self._white_id = white_id
+        self._black_id = black_id
+        self._moves = bytearray()
+        self._move_count = 0
+
+    def add_move(self, move, seconds=0.0):
+        """Appends a move to the record.
+
+        :param move: Move as executed, a list of location tuples including the starting location
+        :param seconds: Time the player took to provide the move
+        """
+        self._moves.append(len(move) - 1)
+        self._moves.extend(square_index(loc, self._board_size) for loc in move)
+        self._moves.extend(_MOVE_TIME.pack(min(int(seconds * 1000), 0xFFFF)))
+        self._move_count += 1
+
+    def finish(self, result):
+        """Returns the packed game record.
+
+        :param result: 'w' if white won, 'b' if black won, 'd' for a draw, or None if the game did not finish
+        :returns bytes: Game record, which can be passed to GameWriter.write
+        """
+        header = _GAME_HEADER.pack(_GAME_HEADER.size - 4 + len(self._moves), self._board_size, RESULT_CODES[result],
+                                   self._white_id, self._black_id, self._move_count)
+        return header + bytes(self._moves)
+
+
+class GameWriter:
+    """A GameWriter appends game records to a log file, creating it if needed."""
+    def __init__(self, path):
+        """Opens the log file at path for appending.
+
+        :raises ValueError: if the file exists and is not a game log
+        """
+        # Check the header before opening for appending, so nothing is left open if the file is not a game log
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, 'rb') as f:
+                _check_header(f.read(_FILE_HEADER.size))
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(_FILE_HEADER.pack(MAGIC, VERSION))
+            self._file.flush()
+        self.games_written = 0
+
+    def write(self, record):
+        """Appends a record returned by GameRecorder.finish and flushes it to the file."""
+        self._file.write(record)
+        self._file.flush()
+        self.games_written += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _check_header(data):
+    if len(data) < _FILE_HEADER.size:
+        raise ValueError('Not a game log file')
+    magic, version = _FILE_HEADER.unpack(data[:_FILE_HEADER.size])
+    if magic != MAGIC:
+        raise ValueError('Not a game log file')
+    if version != VERSION:
+        raise ValueError('Unsupported game log version {}'.format(version))
+
+
+class GameRecord:
+    """A game stored in a GameArchive. Moves are decoded from the archive only when iterated."""
+    def __init__(self, buffer, offset):
+        length, board_size, result, white_id, black_id, move_count = _GAME_HEADER.unpack_from(buffer, offset)
+        self._buffer = buffer
+        self._moves_offset = offset + _GAME_HEADER.size
+        self.offset = offset
+        self.size = length + 4
+        self.board_size = board_size
+        self.result = RESULTS[result]
+        self.white_id = white_id
+        self.black_id = black_id
+        self.move_count = move_count
+
+    def moves(self):
+        """Yields each move of the game as a tuple of the move (list of location tuples) and the seconds taken."""
+        buffer = self._buffer
+        offset = self._moves_offset
+        board_size = self.board_size
+        for _ in range(self.move_count):
+            steps = buffer[offset]
+            move = [square_location(index, board_size) for index in buffer[offset + 1:offset + steps + 2]]
+            offset += steps + 2
+            yield move, _MOVE_TIME.unpack_from(buffer, offset)[0] / 1000
+            offset += _MOVE_TIME.size
+
+    def positions(self):
+        """Replays the game, yielding the board before each move together with the move played.
+
+        The same CheckerBoard instance is updated and yielded each time, copy it to keep a position.
+        """
+        board = CheckerBoard(self.board_size)
+        for move, _ in self.moves():
+            yield board, move
+            board.apply_move(move)
+
+
+class GameArchive:
+    """A GameArchive reads a game log file through a memory map, decoding games lazily as they are iterated."""
+    def __init__(self, path):
+        """Opens the log file at path.
+
+        :raises ValueError: if the file is not a game log
+        """
+        self._file = open(path, 'rb')
+        try:
+            _check_header(self._file.read(_FILE_HEADER.size))
+        except ValueError:
+            self._file.close()
+            raise
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        """Yields each GameRecord in the order the games were written."""
+        offset = _FILE_HEADER.size
+        while offset + _GAME_HEADER.size <= self._size:
+            record = GameRecord(self._map, offset)
+            if offset + record.size > self._size:
+                # Record is still being written
+                break
+            yield record
+            offset += record.size
+
+    def positions(self):
+        """Yields the board before each move of every game, together with the GameRecord and the move played."""
+        for record in self:
+            for board, move in record.positions():
+                yield record, board, move
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
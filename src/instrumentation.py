@@ -0,0 +1,272 @@
+"""Opt-in instrumentation of the engine hot paths and the players' moves.
+
+An Instrumentation records, for each instrumented function, the number of calls, the cumulative and percentile
+latencies and optionally the memory allocated. It works by replacing methods of CheckerBoard with timing wrappers
+while it is enabled, and restoring the original methods when it is disabled, so code runs at full speed when no
+instrumentation is enabled. Times are inclusive: execute_move includes the time spent in _validate_move. Recursive
+calls, such as generate_moves following a multi-jump, are part of the outermost call and not recorded separately.
+
+Statistics can be merged, eg, across the games of a tournament. Optionally, the referee thread and the players' move
+threads are profiled with cProfile, and the profiles can be dumped in the pstats format read by snakeviz, gprof2dot
+or flameprof to draw call graphs and flame graphs:
+
+    instrumentation = Instrumentation(profile=True)
+    result = play_game(8, 0.1, SimpleAI, AlphaBetaAI, instrumentation=instrumentation)
+    instrumentation.print_report()
+    instrumentation.dump_profile('game.prof')
+"""
+from board import CheckerBoard
+import cProfile
+import functools
+import math
+import pstats
+import threading
+import time
+import tracemalloc
+
+
+# CheckerBoard methods instrumented by default
+DEFAULT_METHODS = ('generate_moves', 'legal_moves', 'execute_move', '_validate_move', 'get_winner')
+# Name under which the time players take per move is recorded
+PLAYER_MOVE = 'player.move'
+
+_enabled = None  # Instrumentation currently enabled, methods can only be patched by one at a time
+# Guards CallStats updates, which come from the referee thread and the players' move threads
+_stats_lock = threading.Lock()
+
+
+class CallStats:
+    """Statistics of the calls of one instrumented function.
+
+    Latencies are counted in logarithmic buckets, four per doubling, so statistics of any number of calls take a small
+    constant space, merge exactly, and give percentiles accurate to within 20%.
+    """
+    BUCKETS_PER_DOUBLING = 4
+    __slots__ = ('calls', 'total_seconds', 'max_seconds', 'allocated_bytes', '_histogram')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.allocated_bytes = 0  # Net traced memory allocated by the calls, if allocations are tracked
+        self._histogram = {}  # Number of calls by latency bucket
+
+    def add(self, seconds, allocated_bytes=0):
+        """Records one call."""
+        bucket = int(math.log2(seconds * 1e9) * self.BUCKETS_PER_DOUBLING) if seconds > 1e-9 else 0
+        with _stats_lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            if seconds > self.max_seconds:
+                self.max_seconds = seconds
+            self.allocated_bytes += allocated_bytes
+            self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+
+    def merge(self, other):
+        """Adds the calls recorded by another CallStats."""
+        with _stats_lock:
+            self.calls += other.calls
+            self.total_seconds += other.total_seconds
+            self.max_seconds = max(self.max_seconds, other.max_seconds)
+            self.allocated_bytes += other.allocated_bytes
+            for bucket, count in other._histogram.items():
+                self._histogram[bucket] = self._histogram.get(bucket, 0) + count
+
+    def percentile(self, fraction):
+        """Returns the latency in seconds below which fraction of the calls completed, eg, 0.95."""
+        if self.calls == 0:
+            return 0.0
+        rank = fraction * self.calls
+        seen = 0
+        for bucket in sorted(self._histogram):
+            seen += self._histogram[bucket]
+            if seen >= rank:
+                # Upper bound of the bucket
+                return min(2 ** ((bucket + 1) / self.BUCKETS_PER_DOUBLING) / 1e9, self.max_seconds)
+        return self.max_seconds
+
+    def as_dict(self):
+        """Returns the statistics as a dict of calls, total, mean, p50, p95, p99 and max seconds and allocated bytes."""
+        return {'calls': self.calls, 'total_seconds': self.total_seconds,
+                'mean_seconds': self.total_seconds / self.calls if self.calls else 0.0,
+                'p50_seconds': self.percentile(0.5), 'p95_seconds': self.percentile(0.95),
+                'p99_seconds': self.percentile(0.99), 'max_seconds': self.max_seconds,
+                'allocated_bytes': self.allocated_bytes}
+
+
+class Instrumentation:
+    """An Instrumentation times CheckerBoard methods and player moves while it is enabled."""
+    def __init__(self, methods=DEFAULT_METHODS, track_allocations=False, profile=False):
+        """Inits an Instrumentation with the specified parameters.
+
+        :param methods: Names of the CheckerBoard methods to instrument
+        :param track_allocations: Whether to record the memory allocated by each call with tracemalloc. This slows
+        down every allocation of the program while enabled.
+        :param profile: Whether to profile the enabling thread and the players' moves with cProfile
+        """
+        self._methods = tuple(methods)
+        self._track_allocations = track_allocations
+        self._profile = profile
+        self._stats = {}
+        self._originals = {}
+        self._profilers = []
+        self._profiler = None
+        self._started_tracemalloc = False
+
+    def enable(self):
+        """Starts instrumenting.
+
+        :raises RuntimeError: if another Instrumentation is enabled
+        """
+        global _enabled
+        if _enabled is not None:
+            raise RuntimeError('Another Instrumentation is already enabled')
+        _enabled = self
+        if self._track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        for name in self._methods:
+            original = getattr(CheckerBoard, name)
+            self._originals[name] = original
+            setattr(CheckerBoard, name, self._wrap(name, original))
+        if self._profile:
+            self._profiler = cProfile.Profile()
+            self._profilers.append(self._profiler)
+            self._profiler.enable()
+
+    def disable(self):
+        """Stops instrumenting and restores the original methods. Recorded statistics are kept."""
+        global _enabled
+        if _enabled is not self:
+            return
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler = None
+        for name, original in self._originals.items():
+            setattr(CheckerBoard, name, original)
+        self._originals = {}
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        _enabled = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def _get_call_stats(self, name):
+        if name not in self._stats:
+            self._stats[name] = CallStats()
+        return self._stats[name]
+
+    def _wrap(self, name, func):
+        stats = self._get_call_stats(name)
+        perf_counter = time.perf_counter
+        # Whether each thread is inside a call of func, so only the outermost of recursive calls is recorded
+        active = threading.local()
+        if self._track_allocations:
+            get_traced_memory = tracemalloc.get_traced_memory
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if getattr(active, 'value', False):
+                    return func(*args, **kwargs)
+                active.value = True
+                memory = get_traced_memory()[0]
+                start_time = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    stats.add(perf_counter() - start_time, get_traced_memory()[0] - memory)
+                    active.value = False
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if getattr(active, 'value', False):
+                    return func(*args, **kwargs)
+                active.value = True
+                start_time = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    stats.add(perf_counter() - start_time)
+                    active.value = False
+        return wrapper
+
+    def wrap_player(self, player):
+        """Instruments the move method of a player instance, recorded as PLAYER_MOVE.
+
+        The wrapper measures the time the player's move method runs in its own thread, including any time past the
+        time limit, and profiles that thread if profiling is enabled and no other profiler is active.
+        """
+        move = player.move
+        stats = self._get_call_stats(PLAYER_MOVE)
+
+        @functools.wraps(move)
+        def wrapper(board, time_limit, ret_val):
+            profiler = None
+            if self._profile and _enabled is self:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                    self._profilers.append(profiler)
+                except ValueError:
+                    # From Python 3.12 only one profiler can be active, and the profiler of the enabling thread
+                    # already records every thread
+                    profiler = None
+            start_time = time.perf_counter()
+            try:
+                return move(board, time_limit, ret_val)
+            finally:
+                stats.add(time.perf_counter() - start_time)
+                if profiler is not None:
+                    profiler.disable()
+        player.move = wrapper
+        return player
+
+    def record(self, name, seconds, allocated_bytes=0):
+        """Records one call of a function timed by the caller, eg, a move requested from a PlayerHost."""
+        self._get_call_stats(name).add(seconds, allocated_bytes)
+
+    def merge(self, stats):
+        """Adds statistics returned by get_stats of another Instrumentation, eg, from another game."""
+        for name, call_stats in stats.items():
+            self._get_call_stats(name).merge(call_stats)
+
+    def get_stats(self):
+        """Returns the CallStats of each instrumented function by name."""
+        return dict(self._stats)
+
+    def report(self):
+        """Returns the statistics of each function with at least one call, most total time first.
+
+        :returns list: List of dicts with the function name and the values of CallStats.as_dict
+        """
+        rows = [dict(name=name, **stats.as_dict()) for name, stats in self._stats.items() if stats.calls > 0]
+        return sorted(rows, key=lambda row: -row['total_seconds'])
+
+    def print_report(self):
+        """Prints the statistics of each function to the console"""
+        print('{:<16} {:>9} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+            'function', 'calls', 'total (s)', 'mean (us)', 'p50 (us)', 'p95 (us)', 'max (us)', 'alloc (KiB)'))
+        for row in self.report():
+            print('{:<16} {:>9} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.1f}'.format(
+                row['name'], row['calls'], row['total_seconds'], row['mean_seconds'] * 1e6, row['p50_seconds'] * 1e6,
+                row['p95_seconds'] * 1e6, row['max_seconds'] * 1e6, row['allocated_bytes'] / 1024))
+
+    def dump_profile(self, path):
+        """Writes the cProfile statistics of all profiled threads to path, in the pstats format.
+
+        :returns bool: False if nothing was profiled
+        """
+        profilers = [profiler for profiler in self._profilers if profiler.getstats()]
+        if len(profilers) == 0:
+            return False
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        stats.dump_stats(path)
+        return True
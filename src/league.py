@@ -0,0 +1,359 @@
+"""League of bots rated with Elo and Glicko-2, kept across runs.
+
+A League file holds a registry of the players which ever took part, keyed by player class and version, with their
+ratings and the result of every game played. Ratings are updated as soon as each game completes and the file is
+rewritten after every game, so an interrupted run loses nothing. The version of a player is its VERSION class
+attribute if it has one, otherwise a hash of the source file of its module, so editing a bot registers it as a new
+player while the games of unchanged bots are kept.
+
+A run first plays the games which are missing from the results: each pairing of the given players plays
+games_per_color games with each color, so a re-run only plays the games of new or changed bots. It then optionally
+plays adaptive games, two at a time with colors swapped, between the pairs whose result is expected to be the most
+informative: players with uncertain ratings (a high Glicko-2 rating deviation) against opponents of similar rating.
+
+Usage from the src directory:
+
+    python league.py league.json --adaptive-games 20
+"""
+from game_log import GameWriter
+from players.interface import AbstractPlayer
+from players.simple_ai import SimpleAI, AlphaBetaAI
+from tournament import game_pool, play_game
+from concurrent.futures import as_completed
+import argparse
+import collections
+import hashlib
+import inspect
+import json
+import math
+import os
+
+
+VERSION = 1
+
+ELO_DEFAULT = 1500.0
+GLICKO_DEFAULT_RATING = 1500.0
+GLICKO_DEFAULT_RD = 350.0
+GLICKO_DEFAULT_VOLATILITY = 0.06
+# Constraint on the change of volatility, see Glickman's Glicko-2 paper
+GLICKO_TAU = 0.5
+_GLICKO_SCALE = 173.7178
+
+# Points scored by white for each winner
+_WHITE_SCORES = {'w': 1.0, 'b': 0.0, 'd': 0.5}
+
+
+def player_version(player_class):
+    """Returns the version of a player class: its VERSION attribute, or the hash of the source of its module."""
+    version = getattr(player_class, 'VERSION', None)
+    if version is not None:
+        return str(version)
+    try:
+        with open(inspect.getsourcefile(player_class), 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()[:12]
+    except (OSError, TypeError):
+        return 'unknown'
+
+
+def player_key(player_class):
+    """Returns the key of a player class in the league registry, its qualified name and version."""
+    return '{}.{}@{}'.format(player_class.__module__, player_class.__qualname__, player_version(player_class))
+
+
+def elo_expected(rating, opponent_rating):
+    """Returns the expected score of a player against an opponent, according to their Elo ratings."""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def _glicko_g(phi):
+    return 1 / math.sqrt(1 + 3 * phi * phi / (math.pi * math.pi))
+
+
+def glicko2_update(rating, rd, volatility, opponents):
+    """Updates a Glicko-2 rating with the games of one rating period.
+
+    :param rating: Rating on the Glicko scale, 1500 for a new player
+    :param rd: Rating deviation on the Glicko scale
+    :param volatility: Rating volatility
+    :param opponents: List of (opponent rating, opponent rd, score) tuples, score being 1 for a win, 0.5 for a draw
+    and 0 for a loss
+    :returns tuple: The new rating, rd and volatility
+    """
+    mu = (rating - 1500) / _GLICKO_SCALE
+    phi = rd / _GLICKO_SCALE
+    if len(opponents) == 0:
+        # Only the deviation grows when no game is played
+        return rating, math.sqrt(phi * phi + volatility * volatility) * _GLICKO_SCALE, volatility
+    variance_inverse = 0.0
+    improvement = 0.0
+    for opponent_rating, opponent_rd, score in opponents:
+        g = _glicko_g(opponent_rd / _GLICKO_SCALE)
+        expected = 1 / (1 + math.exp(-g * (mu - (opponent_rating - 1500) / _GLICKO_SCALE)))
+        variance_inverse += g * g * expected * (1 - expected)
+        improvement += g * (score - expected)
+    variance = 1 / variance_inverse
+    delta = variance * improvement
+
+    # New volatility, by the Illinois algorithm
+    a = math.log(volatility * volatility)
+
+    def f(x):
+        exp_x = math.exp(x)
+        return (exp_x * (delta * delta - phi * phi - variance - exp_x) / (2 * (phi * phi + variance + exp_x) ** 2) -
+                (x - a) / (GLICKO_TAU * GLICKO_TAU))
+
+    low = a
+    if delta * delta > phi * phi + variance:
+        high = math.log(delta * delta - phi * phi - variance)
+    else:
+        k = 1
+        while f(a - k * GLICKO_TAU) < 0:
+            k += 1
+        high = a - k * GLICKO_TAU
+    f_low, f_high = f(low), f(high)
+    while abs(high - low) > 1e-6:
+        middle = low + (low - high) * f_low / (f_high - f_low)
+        f_middle = f(middle)
+        if f_middle * f_high <= 0:
+            low, f_low = high, f_high
+        else:
+            f_low /= 2
+        high, f_high = middle, f_middle
+    volatility = math.exp(low / 2)
+
+    phi_star = math.sqrt(phi * phi + volatility * volatility)
+    phi = 1 / math.sqrt(1 / (phi_star * phi_star) + 1 / variance)
+    mu += phi * phi * improvement
+    return mu * _GLICKO_SCALE + 1500, phi * _GLICKO_SCALE, volatility
+
+
+def pairing_information(first, second):
+    """Returns how much a game between two players is expected to tell about their ratings.
+
+    This is the Fisher information of the game's result about the difference of their ratings, weighted by the sum of
+    their rating variances: it is highest for uncertain ratings and for evenly matched players.
+
+    :param first: Player entry of the league registry, see League.get_player
+    :param second: Player entry of the league registry
+    """
+    phi_first = first['rd'] / _GLICKO_SCALE
+    phi_second = second['rd'] / _GLICKO_SCALE
+    g = _glicko_g(math.sqrt(phi_first * phi_first + phi_second * phi_second))
+    expected = 1 / (1 + math.exp(-g * (first['rating'] - second['rating']) / _GLICKO_SCALE))
+    return (phi_first * phi_first + phi_second * phi_second) * g * g * expected * (1 - expected)
+
+
+class League:
+    """A League plays games between bots and keeps their ratings in a file, across runs."""
+    def __init__(self, path, board_size, time_limit, workers=None, isolate_players=True, log_path=None,
+                 k_factor=32):
+        """Inits a League with the specified parameters, loading the league file at path if it exists.
+
+        :param path: League file, written after every game
+        :param board_size: Size of the square board to be used. Must be even and >= 4.
+        :param time_limit: Time in seconds each player has to act
+        :param workers: Number of worker processes. Defaults to the number of cpus.
+        :param isolate_players: Whether to run each player in its own process with a hard time limit, see PlayerHost
+        :param log_path: File to append the game records to, see game_log. Player ids in the records are the ids of
+        the players in the league. Games are not recorded if not provided.
+        :param k_factor: Maximum change of an Elo rating after one game
+        :raises ValueError: if board_size is not an even number or less than 4, or the league file was played with a
+        different board size or time limit
+        """
+        if not board_size % 2 == 0:
+            raise ValueError('Board size must be divisible by 2')
+        if board_size < 4:
+            raise ValueError("Board size must be at least 4")
+        self._path = path
+        self._board_size = board_size
+        self._time_limit = time_limit
+        self._workers = workers or os.cpu_count() or 1
+        self._isolate_players = isolate_players
+        self._log_path = log_path
+        self._k_factor = k_factor
+        self._players = {}
+        self._games = []
+        if os.path.exists(path):
+            self._load()
+        # Number of games played by each (white key, black key) pair
+        self._played = collections.Counter((game['white'], game['black']) for game in self._games)
+
+    def _load(self):
+        with open(self._path) as f:
+            data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError('Unsupported league file version {}'.format(data.get('version')))
+        if data['board_size'] != self._board_size or data['time_limit'] != self._time_limit:
+            raise ValueError('League file was played with board size {} and time limit {}'.format(
+                data['board_size'], data['time_limit']))
+        self._players = data['players']
+        self._games = data['games']
+
+    def save(self):
+        """Writes the league file, replacing the previous one."""
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': VERSION, 'board_size': self._board_size, 'time_limit': self._time_limit,
+                       'players': self._players, 'games': self._games}, f, indent=1)
+        os.replace(temp_path, self._path)
+
+    def register(self, player_class):
+        """Adds a player class to the registry, if this version of it is not registered yet.
+
+        :returns str: Key of the player, see player_key
+        :raises TypeError: if player_class is not a subclass of AbstractPlayer
+        """
+        if not issubclass(player_class, AbstractPlayer):
+            raise TypeError('{} did not implement AbstractPlayer'.format(player_class.__name__))
+        key = player_key(player_class)
+        if key not in self._players:
+            self._players[key] = {'id': len(self._players), 'name': player_class.__name__,
+                                  'version': player_version(player_class), 'elo': ELO_DEFAULT,
+                                  'rating': GLICKO_DEFAULT_RATING, 'rd': GLICKO_DEFAULT_RD,
+                                  'volatility': GLICKO_DEFAULT_VOLATILITY, 'games': 0, 'wins': 0, 'draws': 0,
+                                  'losses': 0}
+        return key
+
+    def get_player(self, key):
+        """Returns the registry entry of a player: a dict with its id, name, version, Elo rating, Glicko-2 rating,
+        rating deviation (rd) and volatility, and its number of games, wins, draws and losses."""
+        return dict(self._players[key])
+
+    def get_games_played(self, white_key, black_key):
+        """Returns the number of games played between two players with these colors."""
+        return self._played[(white_key, black_key)]
+
+    def record_result(self, white_key, black_key, winner):
+        """Updates the ratings of both players with the result of one game, as a rating period of its own.
+
+        :param white_key: Key of the white player
+        :param black_key: Key of the black player
+        :param winner: 'w' if white won, 'b' if black won, 'd' for a draw
+        """
+        white, black = self._players[white_key], self._players[black_key]
+        score = _WHITE_SCORES[winner]
+        expected = elo_expected(white['elo'], black['elo'])
+        white_elo = white['elo'] + self._k_factor * (score - expected)
+        black_elo = black['elo'] - self._k_factor * (score - expected)
+        white_glicko = glicko2_update(white['rating'], white['rd'], white['volatility'],
+                                      [(black['rating'], black['rd'], score)])
+        black_glicko = glicko2_update(black['rating'], black['rd'], black['volatility'],
+                                      [(white['rating'], white['rd'], 1 - score)])
+        for player, elo, (rating, rd, volatility), player_score in ((white, white_elo, white_glicko, score),
+                                                                    (black, black_elo, black_glicko, 1 - score)):
+            player.update(elo=elo, rating=rating, rd=rd, volatility=volatility, games=player['games'] + 1)
+            player['wins' if player_score == 1 else 'draws' if player_score == 0.5 else 'losses'] += 1
+        self._games.append({'white': white_key, 'black': black_key, 'winner': winner})
+        self._played[(white_key, black_key)] += 1
+
+    def run(self, player_classes, games_per_color=1, adaptive_games=0, target_rd=None):
+        """Plays the missing games of every pairing of player_classes, then adaptive games, yielding each result.
+
+        :param player_classes: List of classes implementing AbstractPlayer, defined at module level so they can be
+        sent to the worker processes
+        :param games_per_color: Number of games each pairing plays with each color
+        :param adaptive_games: Number of games played after the missing games, between the most informative pairs
+        :param target_rd: Adaptive games stop early once the rating deviation of every player is below target_rd
+        :returns generator: Yields a (GameResult, white key, black key) tuple as soon as each game completes
+        """
+        classes = {}
+        for player_class in player_classes:
+            classes[self.register(player_class)] = player_class
+        keys = list(classes)
+        self.save()
+        writer = GameWriter(self._log_path) if self._log_path is not None else None
+        try:
+            with game_pool(self._workers) as executor:
+                pairs = [(white, black) for white in keys for black in keys if white != black
+                         for _ in range(games_per_color - self._played[(white, black)])]
+                yield from self._play(executor, classes, pairs, writer)
+                while adaptive_games > 0 and len(keys) > 1:
+                    if target_rd is not None and all(self._players[key]['rd'] < target_rd for key in keys):
+                        break
+                    pairs = []
+                    for first, second in self._adaptive_pairs(keys, max(self._workers // 2, 1)):
+                        pairs.extend([(first, second), (second, first)])
+                    pairs = pairs[:adaptive_games]
+                    adaptive_games -= len(pairs)
+                    yield from self._play(executor, classes, pairs, writer)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def _play(self, executor, classes, pairs, writer):
+        futures = {}
+        for white, black in pairs:
+            future = executor.submit(play_game, self._board_size, self._time_limit, classes[white], classes[black],
+                                     len(self._games) + len(futures), self._isolate_players, writer is not None,
+                                     (self._players[white]['id'], self._players[black]['id']))
+            futures[future] = (white, black)
+        for future in as_completed(futures):
+            result = future.result()
+            white, black = futures[future]
+            if writer is not None:
+                writer.write(result.record)
+                result = result._replace(record=None)
+            self.record_result(white, black, result.winner)
+            self.save()
+            yield result, white, black
+
+    def _adaptive_pairs(self, keys, count):
+        """Returns up to count pairs of distinct players, most informative first, each player in at most one pair."""
+        candidates = sorted(((pairing_information(self._players[first], self._players[second]), first, second)
+                             for i, first in enumerate(keys) for second in keys[i + 1:]), reverse=True)
+        pairs = []
+        used = set()
+        for _, first, second in candidates:
+            if first not in used and second not in used:
+                pairs.append((first, second))
+                used.update((first, second))
+                if len(pairs) == count:
+                    break
+        return pairs
+
+    def get_ratings(self, keys=None):
+        """Returns the registry entries of players, best Glicko-2 rating first, each with its key added.
+
+        :param keys: Keys of the players to return, all registered players if not provided
+        """
+        keys = keys if keys is not None else list(self._players)
+        ratings = [dict(self._players[key], key=key) for key in keys]
+        return sorted(ratings, key=lambda player: -player['rating'])
+
+    def print_report(self, keys=None):
+        """Prints the ratings of players to the console, see get_ratings"""
+        print('{:<24} {:<12} {:>7} {:>7} {:>5} {:>5} {:>4} {:>4} {:>4}'.format('player', 'version', 'elo', 'glicko',
+                                                                               'rd', 'games', 'W', 'D', 'L'))
+        for player in self.get_ratings(keys):
+            print('{:<24} {:<12} {:>7.0f} {:>7.0f} {:>5.0f} {:>5} {:>4} {:>4} {:>4}'.format(
+                player['name'], player['version'], player['elo'], player['rating'], player['rd'], player['games'],
+                player['wins'], player['draws'], player['losses']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rate bots in a league kept across runs.')
+    parser.add_argument('league', help='league file to read and update')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--time-limit', type=float, default=0.1)
+    parser.add_argument('--games-per-color', type=int, default=1)
+    parser.add_argument('--adaptive-games', type=int, default=0, help='number of games between the most informative '
+                                                                      'pairs, after the missing games')
+    parser.add_argument('--target-rd', type=float, default=None, help='stop adaptive games once every rating '
+                                                                      'deviation is below this')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', action='store_true', help='run players in threads instead of worker processes')
+    parser.add_argument('--log', help='file to append the game records to')
+    args = parser.parse_args()
+
+    # Edit this list to include your players
+    players = [SimpleAI, AlphaBetaAI]
+    league = League(args.league, args.board_size, args.time_limit, args.workers, not args.threads, args.log)
+    for result, white, black in league.run(players, args.games_per_color, args.adaptive_games, args.target_rd):
+        print('{} (white) vs {} (black): {}'.format(
+            league.get_player(white)['name'], league.get_player(black)['name'],
+            {'w': 'white wins', 'b': 'black wins', 'd': 'draw'}[result.winner]))
+    league.print_report([player_key(player_class) for player_class in players])
+
+
+if __name__ == '__main__':
+    main()
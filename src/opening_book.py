@@ -0,0 +1,278 @@
+"""Opening books built from recorded games.
+
+Every game starts from the same position, so the moves played in the first plies of many games can be collected
+offline and looked up during a game instead of being searched. An opening book stores, for each position reached in
+the first plies of the games it was built from, the moves played and how the games ended for the player who made
+them.
+
+A book file starts with a 16 byte header (the magic bytes b'CKOB', a format version, the board size, the number of
+slots and the number of positions), followed by an open addressing hash table of 16 byte slots (position hash as
+returned by CheckerBoard.zobrist_hash, offset of the position's moves and number of moves, 0 for an empty slot), and
+then the moves. Each move is the number of games it was played in and the points scored by the player who made it
+(2 per win, 1 per draw) as uint32s, then the number of steps and the squares visited by the piece, as in game_log.
+All values are little endian. OpeningBook memory-maps the file on the first lookup, and finds a position by probing
+the hash table from the slot given by the low bits of its hash.
+
+Usage from the src directory, to build a book from the games recorded by the tournament runner, optionally adding
+self-play games which start with a few random moves:
+
+    python opening_book.py book.ckb --games games.ckl --self-play 200
+"""
+from board import CheckerBoard
+from concurrent.futures import as_completed
+from game_log import GameArchive, GameRecord, square_index, square_location
+from players.simple_ai import AlphaBetaAI
+from tournament import game_pool, play_game
+from random import Random
+import argparse
+import collections
+import math
+import mmap
+import os
+import struct
+
+
+MAGIC = b'CKOB'
+VERSION = 1
+_HEADER = struct.Struct('<4sBB2xII')
+_SLOT = struct.Struct('<QIH2x')
+_MOVE = struct.Struct('<IIB')
+
+BookMove = collections.namedtuple('BookMove', ['move', 'games', 'score'])
+BookMove.__doc__ = """A move stored in an OpeningBook: the move, the number of games it was played in, and the mean
+score of the player who made it, 1 for a win, 0.5 for a draw and 0 for a loss."""
+
+
+def score_lower_bound(score, games, z=1.96):
+    """Returns the lower bound of the Wilson score interval of a move's mean score.
+
+    Moves played in few games get a low bound even if they scored well, so they rank below moves with a slightly lower
+    score over many games.
+
+    :param score: Mean score of the move, between 0 and 1
+    :param games: Number of games the move was played in
+    :param z: Number of standard deviations of the interval, 1.96 for 95% confidence
+    """
+    if games == 0:
+        return 0.0
+    z2 = z * z
+    center = score + z2 / (2 * games)
+    margin = z * math.sqrt(score * (1 - score) / games + z2 / (4 * games * games))
+    return (center - margin) / (1 + z2 / games)
+
+
+class OpeningBookBuilder:
+    """An OpeningBookBuilder collects move statistics from games and writes them to a book file."""
+    def __init__(self, board_size, max_plies=16):
+        """Inits an OpeningBookBuilder with the specified parameters.
+
+        :param board_size: Size of the board of the games to collect. Games on other boards are ignored.
+        :param max_plies: Number of moves collected from the start of each game
+        """
+        self._board_size = board_size
+        self._max_plies = max_plies
+        # [games, points] by position hash and move
+        self._stats = collections.defaultdict(lambda: collections.defaultdict(lambda: [0, 0]))
+        self.games_added = 0
+
+    def add_game(self, moves, result, skip_plies=0):
+        """Adds the opening moves of one game.
+
+        :param moves: Moves of the game in order, each a list of location tuples including the starting location
+        :param result: 'w' if white won, 'b' if black won, 'd' for a draw. Unfinished games are ignored.
+        :param skip_plies: Number of moves at the start of the game which are played but not collected, such as the
+        random moves of self-play games
+        """
+        if result is None:
+            return
+        board = CheckerBoard(self._board_size)
+        for move in moves[:skip_plies]:
+            board.apply_move(move)
+        for move in moves[skip_plies:self._max_plies]:
+            if result == 'd':
+                points = 1
+            else:
+                points = 2 if result == board.current_player else 0
+            stats = self._stats[board.zobrist_hash()][tuple(move)]
+            stats[0] += 1
+            stats[1] += points
+            board.apply_move(move)
+        self.games_added += 1
+
+    def add_record(self, record, skip_plies=0):
+        """Adds a GameRecord read from a game log, see add_game."""
+        if record.board_size == self._board_size:
+            self.add_game([move for move, _ in record.moves()], record.result, skip_plies)
+
+    def add_archive(self, path):
+        """Adds every game of a game log file."""
+        with GameArchive(path) as archive:
+            for record in archive:
+                self.add_record(record)
+
+    def __len__(self):
+        return len(self._stats)
+
+    def write(self, path):
+        """Writes the book file, replacing any existing file at path."""
+        slot_count = 1
+        while slot_count < 2 * len(self._stats):
+            slot_count *= 2
+        slots = [None] * slot_count
+        moves = bytearray()
+        for key, move_stats in self._stats.items():
+            offset = len(moves)
+            for move, (games, points) in move_stats.items():
+                moves.extend(_MOVE.pack(games, points, len(move) - 1))
+                moves.extend(square_index(loc, self._board_size) for loc in move)
+            index = key & (slot_count - 1)
+            while slots[index] is not None:
+                index = (index + 1) & (slot_count - 1)
+            slots[index] = (key, offset, len(move_stats))
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, self._board_size, slot_count, len(self._stats)))
+            for slot in slots:
+                f.write(_SLOT.pack(*slot) if slot is not None else bytes(_SLOT.size))
+            f.write(moves)
+        os.replace(temp_path, path)
+
+
+class OpeningBook:
+    """An OpeningBook looks up book moves in a book file written by OpeningBookBuilder.
+
+    The file is only opened on the first lookup, so a player can create an OpeningBook in its constructor at no cost.
+    """
+    def __init__(self, path):
+        """Inits an OpeningBook for the book file at path. The file does not need to exist."""
+        self._path = path
+        self._map = None
+        self._loaded = False
+        self._board_size = 0
+        self._slot_mask = 0
+
+    def _load(self):
+        self._loaded = True
+        if not os.path.exists(self._path):
+            return
+        with open(self._path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(data) < _HEADER.size:
+            data.close()
+            raise ValueError('Not an opening book file')
+        magic, version, board_size, slot_count, _ = _HEADER.unpack_from(data)
+        if magic != MAGIC:
+            data.close()
+            raise ValueError('Not an opening book file')
+        if version != VERSION:
+            data.close()
+            raise ValueError('Unsupported opening book version {}'.format(version))
+        self._map = data
+        self._board_size = board_size
+        self._slot_mask = slot_count - 1
+        self._moves_offset = _HEADER.size + slot_count * _SLOT.size
+
+    def get_moves(self, board):
+        """Returns the book moves of a position.
+
+        Moves which are not legal in the position, which can only happen if two positions share a hash, are left out.
+
+        :param board: CheckerBoard with the position
+        :returns list: BookMoves, most played first. Empty if the position is not in the book.
+        """
+        if not self._loaded:
+            self._load()
+        if self._map is None:
+            return []
+        key = board.zobrist_hash()
+        index = key & self._slot_mask
+        while True:
+            slot_key, offset, count = _SLOT.unpack_from(self._map, _HEADER.size + index * _SLOT.size)
+            if count == 0:
+                return []
+            if slot_key == key:
+                break
+            index = (index + 1) & self._slot_mask
+        legal_moves = board.legal_moves()
+        book_moves = []
+        offset += self._moves_offset
+        for _ in range(count):
+            games, points, steps = _MOVE.unpack_from(self._map, offset)
+            offset += _MOVE.size
+            move = [square_location(i, self._board_size) for i in self._map[offset:offset + steps + 1]]
+            offset += steps + 1
+            if move in legal_moves:
+                book_moves.append(BookMove(move, games, points / (2 * games)))
+        book_moves.sort(key=lambda book_move: book_move.games, reverse=True)
+        return book_moves
+
+    def get_move(self, board, min_games=2):
+        """Returns the book move with the highest score lower bound in a position, see score_lower_bound.
+
+        :param board: CheckerBoard with the position
+        :param min_games: Minimum number of games a move must have been played in to be chosen
+        :returns list: Move, or None if the position has no book move played in at least min_games games
+        """
+        candidates = [book_move for book_move in self.get_moves(board) if book_move.games >= min_games]
+        if len(candidates) == 0:
+            return None
+        return max(candidates, key=lambda book_move: score_lower_bound(book_move.score, book_move.games)).move
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+def self_play(board_size, player_class, games, time_limit, random_plies=4, workers=None, seed=None):
+    """Plays games of player_class against itself, each starting with a few random moves so the games differ.
+
+    The random moves are part of the records, so pass random_plies as skip_plies to OpeningBookBuilder.add_record to
+    keep them out of the book.
+
+    :returns generator: Yields the GameRecord of each game as it finishes
+    """
+    rng = Random(seed)
+    openings = []
+    for _ in range(games):
+        board = CheckerBoard(board_size)
+        opening = []
+        while len(opening) < random_plies and board.get_winner() is None:
+            move = rng.choice(board.legal_moves())
+            board.apply_move(move)
+            opening.append(move)
+        openings.append(opening)
+    with game_pool(workers) as executor:
+        futures = [executor.submit(play_game, board_size, time_limit, player_class, player_class, game_id,
+                                   record_moves=True, opening=opening)
+                   for game_id, opening in enumerate(openings)]
+        for future in as_completed(futures):
+            yield GameRecord(future.result().record, 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an opening book from recorded and self-play games.')
+    parser.add_argument('book', help='opening book file to write')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--max-plies', type=int, default=16)
+    parser.add_argument('--games', nargs='*', default=[], help='game log files to read')
+    parser.add_argument('--self-play', type=int, default=0, help='number of self-play games to add')
+    parser.add_argument('--random-plies', type=int, default=4,
+                        help='number of random moves starting each self-play game, which are left out of the book')
+    parser.add_argument('--time-limit', type=float, default=0.1)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    builder = OpeningBookBuilder(args.board_size, args.max_plies)
+    for path in args.games:
+        builder.add_archive(path)
+    # Edit this to self-play with your player
+    for record in self_play(args.board_size, AlphaBetaAI, args.self_play, args.time_limit, args.random_plies,
+                            args.workers):
+        builder.add_record(record, args.random_plies)
+    builder.write(args.book)
+    print('Wrote {} positions from {} games to {}'.format(len(builder), builder.games_added, args.book))
+
+
+if __name__ == '__main__':
+    main()
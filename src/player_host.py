@@ -0,0 +1,170 @@
+"""Runs players in their own worker processes with enforced time limits.
+
+A player run in a thread of the referee process shares the interpreter lock with the referee and its opponent, and
+keeps running when it exceeds its time limit. A PlayerHost instead starts the player in a long-lived worker process,
+sends it each position packed by CheckerBoard.serialize, and kills and restarts the worker if the player is still
+running after its time limit, so an overrunning player can not take cpu time from its opponent. The worker is not a
+daemon process, so players may start processes of their own, and it leads its own process group, so these are killed
+along with it.
+"""
+from board import CheckerBoard
+from multiprocessing.connection import wait
+from threading import Thread
+import multiprocessing
+import os
+import signal
+import time
+
+
+def _run_worker(conn, player_class, board_size, player_num):
+    """Worker process entry point, serves move requests for one player until asked to stop."""
+    if hasattr(os, 'setsid'):
+        # Lead a new process group, so the processes started by the player can be killed with the worker
+        os.setsid()
+    player = player_class(board_size, player_num)
+    conn.send(player.get_name())
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        data, time_limit = request
+        ret_val = []  # list representing move returned from player
+        t = Thread(target=player.move, args=(CheckerBoard.deserialize(data).snapshot(), time_limit, ret_val),
+                   daemon=True)
+        t.start()
+        t.join(time_limit)
+        # Send the current value of ret_val, and whether the player is still running and must be stopped
+        conn.send((list(ret_val), t.is_alive()))
+    conn.close()
+
+
+class PlayerHost:
+    """A PlayerHost runs one player in a worker process and requests its moves."""
+    # Extra seconds allowed for sending the position and the move between processes
+    GRACE_PERIOD = 0.1
+
+    def __init__(self, player_class, board_size, player_num, startup_timeout=10):
+        """Inits a PlayerHost and starts the worker process.
+
+        :param player_class: Class implementing AbstractPlayer. It must be defined at module level.
+        :param board_size: Size of the square board to be used.
+        :param player_num: 1 for the white player, 2 for the black player.
+        :param startup_timeout: Time in seconds allowed for the player to be initialized.
+        :raises RuntimeError: if the player does not start within startup_timeout
+        """
+        self._player_class = player_class
+        self._board_size = board_size
+        self._player_num = player_num
+        self._startup_timeout = startup_timeout
+        self._process = None
+        self._conn = None
+        self._name = None
+        self._latencies = []
+        self._overruns = 0
+        self._start()
+
+    def _start(self):
+        self._conn, worker_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_run_worker,
+                                                args=(worker_conn, self._player_class, self._board_size,
+                                                      self._player_num))
+        self._process.start()
+        worker_conn.close()
+        try:
+            # The pipe is closed if the player raises in its constructor
+            name = self._conn.recv() if self._conn.poll(self._startup_timeout) else None
+        except EOFError:
+            name = None
+        if name is None:
+            self._kill()
+            self._process = None
+            raise RuntimeError('Player {} did not start'.format(self._player_class.__name__))
+        self._name = name
+
+    def _kill_group(self):
+        """Kills the worker process and the processes started by the player."""
+        if hasattr(os, 'killpg'):
+            try:
+                os.killpg(self._process.pid, signal.SIGKILL)
+            except OSError:
+                # The worker has not created its process group yet, or the group is already gone
+                pass
+        self._process.kill()
+
+    def _kill(self):
+        self._kill_group()
+        self._process.join()
+        self._conn.close()
+
+    def get_name(self):
+        """Returns the name reported by the player."""
+        return self._name
+
+    def move(self, board, time_limit):
+        """Requests a move from the player.
+
+        If the player is still running when its time limit expires, the move it has provided so far in ret_val is
+        used, and the worker process is killed and restarted for the next move.
+
+        :param board: CheckerBoard with the current position
+        :param time_limit: Time in seconds the player has to act
+        :returns list: Move provided by the player, which may be empty or invalid
+        :raises RuntimeError: if the worker process had to be restarted and the player did not start again, in which
+        case the host can not be used anymore
+        """
+        start_time = time.perf_counter()
+        move = []
+        try:
+            self._conn.send((board.serialize(), time_limit))
+            if self._conn.poll(time_limit + self.GRACE_PERIOD):
+                move, still_running = self._conn.recv()
+            else:
+                # Worker did not answer at all, eg, the player holds the interpreter lock
+                still_running = True
+        except (EOFError, OSError):
+            # Worker process died
+            still_running = True
+        self._latencies.append(time.perf_counter() - start_time)
+        if still_running:
+            self._overruns += 1
+            self._kill()
+            self._start()
+        return move
+
+    def get_stats(self):
+        """Returns timing statistics of the moves requested so far.
+
+        :returns dict: Number of moves, overruns (moves after which the worker process was restarted because the
+        player was still running or had died), and the mean, 95th percentile and maximum latency of a move request in
+        seconds
+        """
+        latencies = sorted(self._latencies)
+        count = len(latencies)
+        return {'moves': count, 'overruns': self._overruns,
+                'mean_latency': sum(latencies) / count if count else 0.0,
+                'p95_latency': latencies[min(count - 1, int(0.95 * count))] if count else 0.0,
+                'max_latency': latencies[-1] if count else 0.0}
+
+    def get_latencies(self):
+        """Returns the list of seconds taken by each move request."""
+        return list(self._latencies)
+
+    def close(self):
+        """Stops the worker process."""
+        if self._process is None:
+            return
+        try:
+            self._conn.send(None)
+            # Wait without joining, so the exited worker is not reaped and its process group id can not be reused
+            # before the processes left behind by the player are killed
+            wait([self._process.sentinel], 1)
+        except (BrokenPipeError, OSError):
+            pass
+        self._kill()
+        self._process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
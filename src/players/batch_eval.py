@@ -0,0 +1,213 @@
+import numpy as np
+
+
+def _table_popcount(words):
+    """Returns the number of set bits of each uint64 of words, counting the bits of each byte with a table."""
+    counts = _BYTE_COUNTS[words.view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+_BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+# numpy < 2.0 has no popcount
+_popcount = getattr(np, 'bitwise_count', _table_popcount)
+
+
+class BatchEvaluator:
+    """A BatchEvaluator scores many positions of the same board size in one call using NumPy.
+
+    Positions are packed into the bitboards used by CheckerBoard, split into 64 bit words, and every evaluation term is
+    computed for the whole batch with bitwise operations and bit counts on the words, so the interpreter overhead is
+    paid once per batch rather than once per position. Search code can either pass a list of boards to evaluate, or
+    push leaf positions one at a time as they are reached and flush them all together. Packing the positions still
+    costs some interpreter time per position, so batches of a few hundred positions on boards larger than 8x8, which
+    need two words per bitboard, are scored about as fast as by the scalar material count of SearchTree.
+
+    The terms, each computed for white minus black, are:
+
+    * material: pawns, plus KING_VALUE per king
+    * advancement: pawns weighted by the fraction of the board they have advanced
+    * back_rank: pawns still on their own back row, guarding against promotions
+    * center: pieces in the middle half of the board
+    * mobility: number of simple moves available, ignoring forced capture
+    """
+    TERMS = ('material', 'advancement', 'back_rank', 'center', 'mobility')
+    DEFAULT_WEIGHTS = {'material': 1.0, 'advancement': 0.2, 'back_rank': 0.1, 'center': 0.1, 'mobility': 0.05}
+    KING_VALUE = 3
+
+    def __init__(self, board_size, weights=None):
+        """Inits a BatchEvaluator with the specified parameters.
+
+        :param board_size: Size of the boards which will be evaluated
+        :param weights: Dict of weights by term name, overriding DEFAULT_WEIGHTS
+        :raises ValueError: if weights contains an unknown term
+        """
+        all_weights = dict(self.DEFAULT_WEIGHTS)
+        for term, weight in (weights or {}).items():
+            if term not in all_weights:
+                raise ValueError('Unknown evaluation term {}'.format(term))
+            all_weights[term] = weight
+        self._weights = np.array([all_weights[term] for term in self.TERMS])
+        n = board_size
+        self._board_size = n
+        self._words = (n * n + 63) // 64
+
+        def mask(squares):
+            return self._to_words([sum(1 << (row * n + col) for row, col in squares)])
+
+        playable = [(row, col) for row in range(n) for col in range(n) if (row + col) % 2 == 1]
+        self._playable = mask(playable)
+        # Squares of each row, for the advancement of pawns
+        self._rows = np.array([mask([(r, c) for r, c in playable if r == row]) for row in range(n)])
+        self._row_fractions = np.arange(n) / (n - 1)
+        quarter = n // 4
+        self._center = mask([(r, c) for r, c in playable if quarter <= r < n - quarter and quarter <= c < n - quarter])
+        # Simple moves one row up (towards white's promotion row) or down, as the change of the bit index and the mask
+        # of the squares the move can start from without leaving the board
+        self._up_steps = [(n - 1, mask([(r, c) for r, c in playable if c > 0 and r < n - 1])),
+                          (n + 1, mask([(r, c) for r, c in playable if c < n - 1 and r < n - 1]))]
+        self._down_steps = [(1 - n, mask([(r, c) for r, c in playable if c < n - 1 and r > 0])),
+                            (-n - 1, mask([(r, c) for r, c in playable if c > 0 and r > 0]))]
+        self._pending = ([], [], [], [])  # White, black and kings bitboards and whether black is to move
+
+    def _to_words(self, bitboards):
+        """Converts a list of bitboards to an array of shape (words, len(bitboards)) of uint64, low word first.
+
+        Words are the first axis so every operation on a word runs on one contiguous array of all positions.
+        """
+        if self._words == 1:
+            return np.array(bitboards, dtype=np.uint64).reshape(1, len(bitboards))
+        length = 8 * self._words
+        data = b''.join(bitboard.to_bytes(length, 'little') for bitboard in bitboards)
+        return np.frombuffer(data, dtype='<u8').reshape(len(bitboards), self._words).T.copy()
+
+    def pack(self, positions):
+        """Packs positions into bitboard words.
+
+        :param positions: List of CheckerBoards or BoardSnapshots
+        :returns tuple: uint64 arrays of white pieces, black pieces and kings, each of shape (words, positions) with
+        square row * board_size + col in bit (row * board_size + col) % 64 of word (row * board_size + col) // 64,
+        and a boolean array which is true where black is to move
+        """
+        return self._pack(positions, True)
+
+    def _pack(self, positions, with_player):
+        """Packs positions as pack does, without finding the players to move unless with_player is set."""
+        white, black, kings = zip(*[position.get_bitboards() for position in positions])
+        black_to_move = None
+        if with_player:
+            black_to_move = np.fromiter((position.current_player == 'b' for position in positions), dtype=bool,
+                                        count=len(positions))
+        return self._to_words(white), self._to_words(black), self._to_words(kings), black_to_move
+
+    def terms(self, positions):
+        """Computes each evaluation term, from white's point of view.
+
+        :param positions: List of CheckerBoards or BoardSnapshots
+        :returns numpy.ndarray: Array of shape (positions, len(TERMS))
+        """
+        white, black, kings, _ = self.pack(positions)
+        return self._terms(white, black, kings)
+
+    def _terms(self, white, black, kings):
+        # Bitboards of both colors are stacked and counted together, so small batches, which spend most of their time
+        # on the overhead of each numpy operation, need fewer operations
+        white_kings = white & kings
+        black_kings = black & kings
+        pawns = np.stack([white ^ white_kings, black ^ black_kings])
+        # Pawns of each color per row, of shape (2, board_size, positions)
+        pawns_by_row = _popcount(pawns[:, np.newaxis] & self._rows).sum(axis=2, dtype=np.int64)
+        white_pawns, black_pawns = pawns_by_row
+        others = np.stack([white_kings, black_kings, white & self._center, black & self._center])
+        white_king_count, black_king_count, white_center, black_center = _popcount(others).sum(axis=1, dtype=np.int64)
+        material = (white_pawns.sum(axis=0) + self.KING_VALUE * white_king_count -
+                    black_pawns.sum(axis=0) - self.KING_VALUE * black_king_count)
+        advancement = self._row_fractions @ white_pawns - (1 - self._row_fractions) @ black_pawns
+        back_rank = white_pawns[0] - black_pawns[-1]
+        center = white_center - black_center
+        empty = self._playable & ~(white | black)
+        # White pieces and black kings move up, black pieces and white kings move down
+        up = self._step_count(np.stack([white, black_kings]), empty, self._up_steps)
+        down = self._step_count(np.stack([white_kings, black]), empty, self._down_steps)
+        mobility = up[0] - up[1] + down[0] - down[1]
+        return np.stack([material, advancement, back_rank, center, mobility], axis=1).astype(float)
+
+    @staticmethod
+    def _shift(words, shift):
+        """Shifts multi-word bitboards, whose words are the second to last axis, towards higher bit indices by shift
+        bits, or lower ones if shift is negative."""
+        if shift > 0:
+            shifted = words << np.uint64(shift)
+            # Bits carried over from the word below
+            shifted[..., 1:, :] |= words[..., :-1, :] >> np.uint64(64 - shift)
+        else:
+            shifted = words >> np.uint64(-shift)
+            shifted[..., :-1, :] |= words[..., 1:, :] << np.uint64(64 + shift)
+        return shifted
+
+    def _step_count(self, pieces, empty, steps):
+        """Counts the simple moves of pieces to empty squares, see _up_steps and _down_steps.
+
+        :param pieces: Bitboard words of shape (..., words, positions)
+        :returns numpy.ndarray: Counts of shape (..., positions)
+        """
+        count = 0
+        for shift, sources in steps:
+            count = count + _popcount(self._shift(pieces & sources, shift) & empty).sum(axis=-2, dtype=np.int64)
+        return count
+
+    def evaluate(self, positions, perspective=None):
+        """Scores positions.
+
+        :param positions: List of CheckerBoards or BoardSnapshots
+        :param perspective: 'w' or 'b' to score every position for that player, or None to score each position for
+        the player to move
+        :returns numpy.ndarray: Array of scores, higher is better for the perspective player
+        """
+        if len(positions) == 0:
+            return np.zeros(0)
+        # The players to move are only needed to score each position for its own player
+        return self._score(*self._pack(positions, perspective is None), perspective)
+
+    def _score(self, white, black, kings, black_to_move, perspective):
+        scores = self._terms(white, black, kings) @ self._weights
+        if perspective == 'b':
+            return -scores
+        elif perspective == 'w':
+            return scores
+        return np.where(black_to_move, -scores, scores)
+
+    def push(self, board):
+        """Queues a position to be scored by the next flush.
+
+        Only the bitboards of the position are kept, so board can be changed afterwards, eg, by undo_move.
+
+        :param board: CheckerBoard or BoardSnapshot to score
+        :returns int: Index of the position's score in the array returned by flush
+        """
+        white, black, kings = board.get_bitboards()
+        pending_white, pending_black, pending_kings, black_to_move = self._pending
+        pending_white.append(white)
+        pending_black.append(black)
+        pending_kings.append(kings)
+        black_to_move.append(board.current_player == 'b')
+        return len(pending_white) - 1
+
+    def flush(self, perspective=None):
+        """Scores all queued positions and clears the queue.
+
+        :param perspective: 'w', 'b' or None, as for evaluate
+        :returns numpy.ndarray: Scores in the order the positions were pushed
+        """
+        white, black, kings, black_to_move = self._pending
+        self._pending = ([], [], [], [])
+        if len(white) == 0:
+            return np.zeros(0)
+        return self._score(self._to_words(white), self._to_words(black), self._to_words(kings),
+                           np.array(black_to_move, dtype=bool), perspective)
+
+    def clear(self):
+        """Discards the queued positions."""
+        self._pending = ([], [], [], [])
+
+    def __len__(self):
+        return len(self._pending[0])
@@ -0,0 +1,272 @@
+from .interface import AbstractPlayer
+from math import log, sqrt
+from random import Random
+import multiprocessing
+import os
+import time
+
+
+class MCTSNode:
+    """A node of the Monte Carlo search tree.
+
+    Nodes do not store positions: the position of a node is reached by applying the moves on the path from the root.
+    Nodes do not link to their parent either, so a discarded subtree holds no reference cycles and is freed as soon as
+    it is dropped, without waiting for the cyclic garbage collector.
+    """
+    __slots__ = ('move', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move=None):
+        self.move = move
+        self.children = []
+        self.untried = None  # Legal moves not yet expanded, None until the node is first visited
+        self.visits = 0
+        self.wins = 0.0  # From the point of view of the player who made move
+
+    def select_child(self, exploration):
+        """Returns the child with the highest UCT value."""
+        log_visits = log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits + exploration * sqrt(log_visits / child.visits))
+
+    def count(self):
+        """Returns the number of nodes in the subtree of this node."""
+        count = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            count += 1
+            stack.extend(node.children)
+        return count
+
+
+class MCTSTree:
+    """Monte Carlo tree search with UCT selection and random playouts.
+
+    Each iteration selects a path down the tree with UCT, expands one untried move, plays the game out with random
+    moves from the resulting position and backs the result up the path. A single board is updated with apply_move and
+    undo_move along the path, so no positions are copied. Once the tree holds max_nodes nodes, iterations only select
+    and play out, without expanding. The tree is kept between moves: if the new position is reached by two moves from
+    the previous root, that subtree becomes the new root.
+    """
+    # Exploration constant of the UCT formula
+    EXPLORATION = 1.4
+    # Plies after which a playout is stopped and scored by material
+    PLAYOUT_LIMIT = 150
+
+    def __init__(self, max_nodes=200000, seed=None):
+        """Inits an MCTSTree with the specified parameters.
+
+        :param max_nodes: Maximum number of nodes kept in the tree
+        :param seed: Seed of the random playouts
+        """
+        self.max_nodes = max_nodes
+        self._rng = Random(seed)
+        self._root = None
+        self._root_board = None
+        self._node_count = 0
+        self.iterations = 0
+
+    def _set_root(self, board):
+        """Reuses the subtree of the previous search which matches board, or starts a new tree."""
+        if self._root is not None:
+            key = board.zobrist_hash()
+            previous = self._root_board
+            for child in self._root.children:
+                child_record = previous.apply_move(child.move)
+                for grandchild in child.children:
+                    record = previous.apply_move(grandchild.move)
+                    found = previous.zobrist_hash() == key
+                    previous.undo_move(record)
+                    if found:
+                        previous.undo_move(child_record)
+                        grandchild.move = None
+                        self._root = grandchild
+                        self._root_board = board.copy()
+                        self._node_count = grandchild.count()
+                        return
+                previous.undo_move(child_record)
+        self._root = MCTSNode()
+        self._root_board = board.copy()
+        self._node_count = 1
+
+    def search(self, board, end_time):
+        """Searches board until end_time.
+
+        :param board: CheckerBoard to search. It is modified during the search and restored before returning.
+        :param end_time: Value of time.monotonic() at which the search stops.
+        :returns dict: Number of visits and wins of each move of the root, keyed by the move as a tuple
+        """
+        self._set_root(board)
+        self.iterations = 0
+        # A playout takes much longer than reading the clock, so the clock is checked every iteration
+        while time.monotonic() < end_time:
+            self._iterate(board)
+            self.iterations += 1
+        return {tuple(child.move): (child.visits, child.wins) for child in self._root.children}
+
+    def _iterate(self, board):
+        node = self._root
+        path = [node]
+        records = []
+        # Selection
+        while node.untried is not None and len(node.untried) == 0 and len(node.children) > 0:
+            node = node.select_child(self.EXPLORATION)
+            path.append(node)
+            records.append(board.apply_move(node.move))
+        # Expansion
+        if node.untried is None:
+            node.untried = list(board.legal_moves())
+            self._rng.shuffle(node.untried)
+        if len(node.untried) > 0 and self._node_count < self.max_nodes:
+            child = MCTSNode(node.untried.pop())
+            node.children.append(child)
+            self._node_count += 1
+            node = child
+            path.append(node)
+            records.append(board.apply_move(node.move))
+        # Playout
+        winner = self._playout(board)
+        # Backpropagation, the player who made the move of the last node is the opponent of the player to move
+        player = 'w' if board.current_player == 'b' else 'b'
+        for record in reversed(records):
+            board.undo_move(record)
+        for node in reversed(path):
+            node.visits += 1
+            if winner == player:
+                node.wins += 1
+            elif winner == 'd':
+                node.wins += 0.5
+            player = 'w' if player == 'b' else 'b'
+
+    def _playout(self, board):
+        """Plays random moves from board and returns the winner. The board is restored before returning."""
+        records = []
+        winner = board.get_winner()
+        while winner is None and len(records) < self.PLAYOUT_LIMIT:
+            records.append(board.apply_move(self._rng.choice(board.legal_moves())))
+            winner = board.get_winner()
+        if winner is None:
+            # Score unfinished playouts by material, kings worth 3 pawns
+            white_pawns, white_kings = board.count_pieces('w')
+            black_pawns, black_kings = board.count_pieces('b')
+            balance = white_pawns + 3 * white_kings - black_pawns - 3 * black_kings
+            winner = 'w' if balance > 0 else 'b' if balance < 0 else 'd'
+        for record in reversed(records):
+            board.undo_move(record)
+        return winner
+
+
+_default_workers = None
+
+
+def set_default_workers(workers):
+    """Sets the number of trees an MCTSPlayer searches in parallel when not given workers, for the current process.
+
+    Programs which run several games at once, such as tournament.Tournament, call this in each of their worker
+    processes so the players of all games together do not start more processes than there are cpus.
+
+    :param workers: Number of trees, including the player's own, or None for the number of cpus
+    """
+    global _default_workers
+    _default_workers = workers
+
+
+def _run_worker(conn, max_nodes, seed):
+    """Worker process entry point, runs searches on its own tree until asked to stop or the player process exits."""
+    from board import CheckerBoard
+    tree = MCTSTree(max_nodes, seed)
+    parent = multiprocessing.parent_process()
+    while True:
+        # Poll so the worker notices if the player process was killed
+        if not conn.poll(1):
+            if parent is not None and not parent.is_alive():
+                break
+            continue
+        try:
+            request = conn.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        sequence, data, seconds = request
+        stats = tree.search(CheckerBoard.deserialize(data), time.monotonic() + seconds)
+        conn.send((sequence, stats))
+    conn.close()
+
+
+class MCTSPlayer(AbstractPlayer):
+    """Player using root-parallel Monte Carlo tree search.
+
+    The player searches its own tree while each of workers - 1 worker processes searches an independent tree of the
+    same position with different random playouts. The visit counts of the root moves of all trees are added up and the
+    most visited move is played. Workers are started with the player and keep their trees between moves.
+    """
+    def __init__(self, board_size, player_num, workers=None, max_nodes=200000):
+        """Inits an MCTSPlayer with the specified parameters.
+
+        :param board_size: The number of squares wide each side of the board is.
+        :param player_num: 1 for the white player, 2 for the black player.
+        :param workers: Number of trees searched in parallel, including the player's own. Defaults to the value set by
+        set_default_workers, or the number of cpus.
+        :param max_nodes: Maximum number of nodes of each tree
+        """
+        self._tree = MCTSTree(max_nodes)
+        self._workers = []
+        self._sequence = 0  # Number of the current search, echoed by the workers with their results
+        if workers is None:
+            workers = _default_workers or os.cpu_count() or 1
+        for i in range(workers - 1):
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_run_worker, args=(worker_conn, max_nodes, os.getpid() * 64 + i),
+                                              daemon=True)
+            process.start()
+            worker_conn.close()
+            self._workers.append((process, conn))
+
+    def move(self, board, time_limit, ret_val):
+        end_time = time.monotonic() + 0.85 * time_limit  # Only use a portion of allotted to account for overhead
+        moves = board.legal_moves()
+        if len(moves) == 0:
+            return
+        ret_val.extend(moves[0])
+        if len(moves) == 1:
+            return
+        # Workers stop a little earlier, to leave time for sending the results back
+        worker_seconds = 0.9 * (end_time - time.monotonic())
+        data = board.serialize()
+        self._sequence += 1
+        for _, conn in self._workers:
+            conn.send((self._sequence, data, worker_seconds))
+        stats = self._tree.search(board.copy(), end_time)
+        legal_moves = set(tuple(move) for move in moves)
+        for _, conn in self._workers:
+            # Results of a previous search which arrive late, even after this request was sent, are discarded
+            while conn.poll(max(end_time - time.monotonic(), 0)):
+                sequence, worker_stats = conn.recv()
+                if sequence == self._sequence:
+                    break
+            else:
+                continue
+            for move, (visits, wins) in worker_stats.items():
+                if move not in legal_moves:
+                    continue
+                total_visits, total_wins = stats.get(move, (0, 0))
+                stats[move] = (total_visits + visits, total_wins + wins)
+        if len(stats) > 0:
+            ret_val[:] = list(max(stats, key=lambda move: stats[move][0]))
+
+    def close(self):
+        """Stops the worker processes."""
+        for process, conn in self._workers:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(1)
+            if process.is_alive():
+                process.kill()
+            conn.close()
+        self._workers = []
+
+    def get_name(self):
+        return "MCTS"
@@ -1,82 +1,491 @@
 from .interface import AbstractPlayer
+from .transposition import TranspositionTable
+from array import array
 import time
-import collections
-import copy
 
 
 class SimpleAI(AbstractPlayer):
-    def __init__(self, board_size, player_num):
+    # Search modes
+    MINIMAX = 'minimax'  # Build the game tree breadth-first, then evaluate it with minimax
+    ALPHA_BETA = 'alpha_beta'  # Iterative deepening depth-first alpha-beta search
+
+    def __init__(self, board_size, player_num, search_mode=MINIMAX, batch_eval=False, tablebase=None,
+                 opening_book=None):
+        """Inits a SimpleAI with the specified parameters.
+
+        :param board_size: The number of squares wide each side of the board is.
+        :param player_num: 1 for the white player, 2 for the black player.
+        :param search_mode: MINIMAX or ALPHA_BETA
+        :param batch_eval: In MINIMAX mode, score all leaves of the game tree in one batch with a BatchEvaluator,
+        which adds positional terms to the material count. Requires numpy.
+        :param tablebase: In ALPHA_BETA mode, Tablebase used to score positions with few pieces exactly
+        :param opening_book: OpeningBook to play moves from without searching, while the game is in the book
+        :raises ValueError: if search_mode is not a known mode
+        """
+        if search_mode not in (self.MINIMAX, self.ALPHA_BETA):
+            raise ValueError('Unknown search mode {}'.format(search_mode))
         self._player = 'w' if player_num == 1 else 'b'
+        self._search_mode = search_mode
+        self._search = AlphaBetaSearch(tablebase=tablebase) if search_mode == self.ALPHA_BETA else None
+        self._opening_book = opening_book
+        self._evaluator = None
+        if batch_eval:
+            # Imported here so numpy is only needed when batch evaluation is used
+            from .batch_eval import BatchEvaluator
+            self._evaluator = BatchEvaluator(board_size)
+            # Measured seconds the evaluator takes per position, starting from a conservative guess
+            self._evaluation_seconds = 5e-6
 
     def move(self, board, time_limit, ret_val):
         start_time = time.monotonic()
         end_time = start_time + 0.85 * time_limit  # Only use a portion of allotted to account for overhead
-        nodes = collections.deque()
-        root_node = ProcessingNode(board, self._player)
-        nodes.append(root_node)
-        # Build game tree breadth-first until time expires
-        while time.monotonic() < end_time and len(nodes) > 0:
-            node = nodes.popleft()
-            nodes.extend(node.generate_child_nodes())
+        if self._opening_book is not None:
+            book_move = self._opening_book.get_move(board)
+            if book_move is not None:
+                ret_val.extend(book_move)
+                return
+        if self._search_mode == self.ALPHA_BETA:
+            self._search.search(board.copy(), end_time, ret_val)
+            return
+        tree = SearchTree(board, self._player, self._evaluator)
+        if self._evaluator is None:
+            # Build game tree breadth-first until time expires
+            while time.monotonic() < end_time and tree.expand_next():
+                pass
+        else:
+            # Stop early enough to score every node of the tree in time
+            while time.monotonic() + len(tree) * self._evaluation_seconds < end_time and tree.expand_next():
+                pass
+            evaluation_start = time.monotonic()
+            tree.evaluate_batch()
+            self._evaluation_seconds = max((time.monotonic() - evaluation_start) / len(tree), 1e-7)
+        tree.calculate_utility()
         # Best move needs to be added to ret_val to return to caller since this will be running on a separate thread
-        ret_val.extend(root_node.get_best_move())
+        best_move = tree.get_best_move()
+        if best_move is not None:
+            ret_val.extend(best_move)
+        elif len(board.legal_moves()) > 0:
+            # Time ran out before the root was expanded
+            ret_val.extend(board.legal_moves()[0])
 
     def get_name(self):
         return "SimpleAI"
 
 
-class ProcessingNode:
-    """A ProcessingNode represents a node in the game tree."""
-    def __init__(self, board, player, move=None):
-        """Inits a ProcessingNode with the specified parameters.
+class AlphaBetaAI(SimpleAI):
+    """SimpleAI using the iterative deepening alpha-beta search mode."""
+    def __init__(self, board_size, player_num):
+        super().__init__(board_size, player_num, SimpleAI.ALPHA_BETA)
+
+    def get_name(self):
+        return "SimpleAI (alpha-beta)"
+
+
+class SearchTimeout(Exception):
+    """Raised inside AlphaBetaSearch to unwind the search when time runs out."""
+
+
+class AlphaBetaSearch:
+    """Iterative deepening negamax search with alpha-beta pruning.
+
+    Each iteration searches one move deeper than the last. Moves are ordered with the best move stored in the
+    transposition table (the best move of the previous iteration), then killer moves which caused a cutoff at the same
+    ply, then longer captures and the history heuristic. The best move found so far is always kept in ret_val, so the
+    caller has a move whenever time runs out.
+
+    If a Tablebase is provided, positions it covers are scored from the tablebase instead of being searched, when the
+    tablebase result is a win or loss reached before the game is decided by piece count. The tablebase ignores the 40
+    move end game rule, so draws and longer results are searched instead. Tablebase wins score below
+    WIN_SCORE - MAX_DEPTH, so they do not stop the iterative deepening.
+
+    Win and loss scores count the plies from the root, so a quicker win scores higher. In the transposition table they
+    are stored counting from the position instead, and converted back at the ply where they are probed, so a result
+    is still correct when the position is reached at another ply.
+    """
+    WIN_SCORE = 10000
+    TABLEBASE_WIN_SCORE = WIN_SCORE // 2
+    # Scores beyond this are wins or losses, which depend on the ply, rather than evaluations
+    WIN_THRESHOLD = TABLEBASE_WIN_SCORE // 2
+    MAX_DEPTH = 64
+    # Number of nodes searched between checks of the clock
+    CHECK_INTERVAL = 64
+
+    def __init__(self, table=None, tablebase=None):
+        """Inits an AlphaBetaSearch with the specified parameters.
+
+        :param table: TranspositionTable to use. A new table is created if not provided.
+        :param tablebase: Tablebase to probe for positions with few pieces, or None
+        """
+        self.table = table if table is not None else TranspositionTable()
+        self.tablebase = tablebase
+        self.nodes = 0
+        self.depth = 0
+        self._end_time = 0
+        self._killers = []
+        self._history = {}
+
+    def search(self, board, end_time, ret_val):
+        """Searches board for the best move of the current player until end_time.
+
+        :param board: CheckerBoard to search. It is modified during the search and restored unless time runs out.
+        :param end_time: Value of time.monotonic() at which the search stops.
+        :param ret_val: List which is kept filled with the best move found so far.
+        :returns int: Score of the best move, from the point of view of the current player
+        """
+        moves = board.legal_moves()
+        if len(moves) == 0:
+            return -self.WIN_SCORE
+        ret_val[:] = moves[0]
+        if len(moves) == 1:
+            return 0
+        result = self._probe_tablebase(board)
+        if result is not None:
+            move = self.tablebase.best_move(board)
+            if move is not None:
+                ret_val[:] = move
+                return self._tablebase_score(result, 0)
+        self.nodes = 0
+        self.depth = 0
+        self._end_time = end_time
+        self._killers = [[] for _ in range(self.MAX_DEPTH + 1)]
+        self._history = {}
+        self.table.new_search()
+        score = 0
+        for depth in range(1, self.MAX_DEPTH + 1):
+            try:
+                score = self._search_root(board, depth, ret_val)
+            except SearchTimeout:
+                break
+            self.depth = depth
+            if abs(score) >= self.WIN_SCORE - self.MAX_DEPTH:
+                # Forced win or loss found, deeper searches can not change the result
+                break
+        return score
+
+    def _search_root(self, board, depth, ret_val):
+        entry = self.table.probe(board.zobrist_hash())
+        moves = self._order_moves(board.legal_moves(), entry.move if entry is not None else None, 0)
+        alpha, beta = -self.WIN_SCORE - 1, self.WIN_SCORE + 1
+        best_move = None
+        for move in moves:
+            record = board.apply_move(move)
+            try:
+                score = -self._alpha_beta(board, depth - 1, -beta, -alpha, 1)
+            finally:
+                board.undo_move(record)
+            if score > alpha:
+                alpha = score
+                best_move = move
+                # The first move searched is the previous best, so any move beating it is safe to play even if
+                # this iteration does not finish
+                ret_val[:] = move
+        self.table.store(board.zobrist_hash(), depth, alpha, TranspositionTable.EXACT, best_move)
+        return alpha
+
+    def _alpha_beta(self, board, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self.nodes % self.CHECK_INTERVAL == 0 and time.monotonic() >= self._end_time:
+            raise SearchTimeout()
+        key = board.zobrist_hash()
+        entry = self.table.probe(key)
+        tt_move = None
+        if entry is not None:
+            tt_move = entry.move
+            if entry.depth >= depth:
+                value = self._from_table(entry.value, ply)
+                if entry.flag == TranspositionTable.EXACT:
+                    return value
+                elif entry.flag == TranspositionTable.LOWER_BOUND:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+        winner = board.get_winner()
+        if winner is not None:
+            if winner == 'd':
+                return 0
+            return self.WIN_SCORE - ply if winner == board.current_player else ply - self.WIN_SCORE
+        result = self._probe_tablebase(board)
+        if result is not None:
+            return self._tablebase_score(result, ply)
+        if depth <= 0 or ply >= self.MAX_DEPTH:
+            return self.evaluate(board)
+
+        alpha_orig = alpha
+        best_score = -self.WIN_SCORE - 1
+        best_move = None
+        for move in self._order_moves(board.legal_moves(), tt_move, ply):
+            record = board.apply_move(move)
+            try:
+                score = -self._alpha_beta(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.undo_move(record)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                self._record_cutoff(move, depth, ply)
+                break
+
+        if best_score <= alpha_orig:
+            flag = TranspositionTable.UPPER_BOUND
+        elif best_score >= beta:
+            flag = TranspositionTable.LOWER_BOUND
+        else:
+            flag = TranspositionTable.EXACT
+        self.table.store(key, depth, self._to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _to_table(self, score, ply):
+        """Converts a win or loss score counted from the root to one counted from the position at ply."""
+        if score > self.WIN_THRESHOLD:
+            return score + ply
+        elif score < -self.WIN_THRESHOLD:
+            return score - ply
+        return score
+
+    def _from_table(self, value, ply):
+        """Converts a win or loss score stored in the table to one counted from the root, see _to_table."""
+        if value > self.WIN_THRESHOLD:
+            return value - ply
+        elif value < -self.WIN_THRESHOLD:
+            return value + ply
+        return value
 
-        :param board: CheckerBoard representation at this node.
+    def _probe_tablebase(self, board):
+        """Returns the TablebaseResult of board if it is a win or loss within the moves left, None otherwise."""
+        if self.tablebase is None:
+            return None
+        result = self.tablebase.probe(board)
+        if result is None or result.result == self.tablebase.DRAW:
+            return None
+        return result if result.distance <= board.get_end_game_moves_left() else None
+
+    def _tablebase_score(self, result, ply):
+        """Converts a TablebaseResult to a score which prefers quicker wins and slower losses."""
+        if result.result == self.tablebase.WIN:
+            return max(self.TABLEBASE_WIN_SCORE - ply - result.distance, 1)
+        elif result.result == self.tablebase.LOSS:
+            return min(ply + result.distance - self.TABLEBASE_WIN_SCORE, -1)
+        return 0
+
+    def _order_moves(self, moves, tt_move, ply):
+        killers = self._killers[ply]
+        history = self._history
+
+        def priority(move):
+            return (move == tt_move, move in killers, len(move), history.get((move[0], move[-1]), 0))
+        return sorted(moves, key=priority, reverse=True)
+
+    def _record_cutoff(self, move, depth, ply):
+        killers = self._killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        key = (move[0], move[-1])
+        self._history[key] = self._history.get(key, 0) + depth * depth
+
+    @staticmethod
+    def evaluate(board):
+        """Scores board by material, from the point of view of the current player. Kings are worth 3 pawns."""
+        player = board.current_player
+        pawns, kings = board.count_pieces(player)
+        opponent_pawns, opponent_kings = board.count_pieces('b' if player == 'w' else 'w')
+        return pawns + 3 * kings - opponent_pawns - 3 * opponent_kings
+
+
+class SearchTree:
+    """A game tree built breadth-first and stored in parallel arrays.
+
+    Nodes are numbered in the order they are created, which is breadth-first, so the nodes of each depth are contiguous
+    and children always come after their parents. For each node the tree stores the parent it was first reached from,
+    the move from that parent (an index into a table of distinct moves), its range of entries in a shared array of
+    child indices, and its utility. Positions are not stored: the position of a node is rebuilt when needed by applying
+    the moves on the path from the root. A position reached at the same depth through a different order of moves is
+    linked to the existing node instead of being created and expanded again, so the tree can not contain cycles.
+
+    Nodes are scored by material as they are created, or, if a BatchEvaluator is given, pushed to it while their
+    position is at hand and scored all at once by evaluate_batch.
+    """
+    def __init__(self, board, player, evaluator=None):
+        """Inits a SearchTree with the specified parameters.
+
+        :param board: CheckerBoard at the root of the tree. It is copied.
         :param player: Player whose optimal move the game tree is solving for. 'w' for white, 'b' for black.
-        :param move: Move which resulted in reaching this node.
+        :param evaluator: BatchEvaluator to score the nodes with, see evaluate_batch. Positions it had queued are
+        discarded.
         """
-        self._children = []
+        self._root_board = board.copy()
         self._player = player
-        self._board = board
-        self.move = move
+        self._evaluator = evaluator
+        if evaluator is not None:
+            evaluator.clear()
+            evaluator.push(board)
+        self._moves = []  # Distinct moves of the tree
+        self._move_indices = {}  # Index in _moves by move as a tuple
+        self._parents = array('i', [-1])
+        self._node_moves = array('I', [0])
+        self._first_children = array('i', [0])
+        self._child_counts = array('H', [0])
+        self._utilities = array('f', [self.evaluate(board, player)])
+        self._children = array('i')
+        self._level_starts = [0]  # Index of the first node of each depth
+        self._next_node = 0  # Nodes before this one have been expanded
+        # Board of the last parent whose children were rebuilt, since siblings are usually expanded one after another
+        self._cached_parent = -1
+        self._cached_board = None
+        # Open addressing hash table of the nodes of the depth being created, by position hash
+        self._table_keys = array('Q')
+        self._table_nodes = array('i')
+        self._table_count = 0
 
-    def calculate_utility(self):
-        """Calculate the utility of the move represented by this node."""
-        if len(self._children) == 0:
-            # If there are no children, this is leaf node. Utility based on pieces on the board.
-            return sum([(1 if i.lower() == self._player else -1) * (1 if i.islower() else 3)
-                        for row in self._board for i in row if i != 0 and i != '_'])
-        elif self._board.current_player == self._player:
-            # If this node represents a move by this player, the optimal move will be chosen, so return max of children
-            return max([c.calculate_utility() for c in self._children])
-        else:
-            # If this node represents a move by opponent, assume opponent will play optimally, so return min of children
-            return min([c.calculate_utility() for c in self._children])
+    def __len__(self):
+        return len(self._parents)
 
-    def generate_child_nodes(self):
-        """Creates children nodes in the game tree.
+    @staticmethod
+    def evaluate(board, player):
+        """Scores board by material from the point of view of player. Kings are worth 3 pawns."""
+        pawns, kings = board.count_pieces(player)
+        opponent_pawns, opponent_kings = board.count_pieces('b' if player == 'w' else 'w')
+        return pawns + 3 * kings - opponent_pawns - 3 * opponent_kings
 
-        :return list: List of ProcessingNode descendants of this node.
+    def get_board(self, index):
+        """Returns a new CheckerBoard with the position of a node."""
+        parent = self._parents[index]
+        if parent < 0:
+            return self._root_board.copy()
+        if parent != self._cached_parent:
+            self._cached_board = self.get_board(parent)
+            self._cached_parent = parent
+        board = self._cached_board.copy()
+        board.apply_move(self._moves[self._node_moves[index]])
+        return board
+
+    def expand_next(self):
+        """Creates the children of the next node in breadth-first order.
+
+        :returns bool: False if there are no nodes left to expand
         """
-        self._children.clear()
-        pieces = self._board.get_locations_by_color(self._board.current_player)
-        all_moves = []
-        all_jumps = []
-        for piece in pieces:
-            is_jump, moves = self._board.generate_moves(piece)
-            for move in moves:
-                # Execute move on copy of board and create new node
-                board_copy = copy.deepcopy(self._board)
-                board_copy.execute_move(move)
-                if is_jump:
-                    all_jumps.append(ProcessingNode(board_copy, self._player, move))
-                else:
-                    all_moves.append(ProcessingNode(board_copy, self._player, move))
-        if len(all_jumps) > 0:
-            self._children.extend(all_jumps)
+        index = self._next_node
+        if index >= len(self._parents):
+            return False
+        self._next_node += 1
+        if index == self._level_starts[-1]:
+            # First node of its depth, the children created from now on are one level deeper
+            self._level_starts.append(len(self._parents))
+            self._reset_table(64)
+        board = self.get_board(index)
+        moves = board.legal_moves()
+        self._first_children[index] = len(self._children)
+        self._child_counts[index] = len(moves)
+        for move in moves:
+            record = board.apply_move(move)
+            key = board.zobrist_hash()
+            slot = self._find_slot(key)
+            child = self._table_nodes[slot]
+            if child < 0:
+                child = self._add_node(index, move, board)
+                self._table_keys[slot] = key
+                self._table_nodes[slot] = child
+                self._table_count += 1
+                if 2 * self._table_count > len(self._table_keys):
+                    self._grow_table()
+            board.undo_move(record)
+            self._children.append(child)
+        return True
+
+    def _add_node(self, parent, move, board):
+        key = tuple(move)
+        move_index = self._move_indices.get(key)
+        if move_index is None:
+            move_index = self._move_indices[key] = len(self._moves)
+            self._moves.append(move)
+        self._parents.append(parent)
+        self._node_moves.append(move_index)
+        self._first_children.append(0)
+        self._child_counts.append(0)
+        if self._evaluator is None:
+            self._utilities.append(self.evaluate(board, self._player))
         else:
-            self._children.extend(all_moves)
-        return self._children
+            self._utilities.append(0)
+            self._evaluator.push(board)
+        return len(self._parents) - 1
+
+    def _reset_table(self, capacity):
+        self._table_keys = array('Q', bytes(8 * capacity))
+        self._table_nodes = array('i', [-1]) * capacity
+        self._table_count = 0
+
+    def _find_slot(self, key):
+        """Returns the slot of the table holding key, or the empty slot where it should be inserted."""
+        mask = len(self._table_keys) - 1
+        slot = key & mask
+        while self._table_nodes[slot] >= 0 and self._table_keys[slot] != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow_table(self):
+        keys, nodes = self._table_keys, self._table_nodes
+        self._reset_table(2 * len(keys))
+        for key, node in zip(keys, nodes):
+            if node >= 0:
+                slot = self._find_slot(key)
+                self._table_keys[slot] = key
+                self._table_nodes[slot] = node
+                self._table_count += 1
+
+    def get_leaves(self):
+        """Returns the indices of the nodes without children."""
+        return [index for index in range(len(self._parents))
+                if index >= self._next_node or self._child_counts[index] == 0]
+
+    def evaluate_batch(self):
+        """Scores every node of the tree with the evaluator it was created with, in one batch."""
+        self._utilities = array('f')
+        self._utilities.frombytes(self._evaluator.flush(self._player).astype('=f4').tobytes())
+
+    def set_utility(self, index, utility):
+        """Sets the utility of a leaf, eg, from a batch evaluation, instead of the material count."""
+        self._utilities[index] = utility
+
+    def calculate_utility(self):
+        """Computes the minimax utility of every expanded node from the utilities of the leaves.
+
+        :returns float: Utility of the root
+        """
+        children = self._children
+        utilities = self._utilities
+        depth = len(self._level_starts) - 1
+        for index in range(self._next_node - 1, -1, -1):
+            while index < self._level_starts[depth]:
+                depth -= 1
+            count = self._child_counts[index]
+            if count == 0:
+                continue
+            first = self._first_children[index]
+            child_utilities = [utilities[child] for child in children[first:first + count]]
+            # The player is to move at even depths: it will choose the optimal move, while the opponent is assumed
+            # to play optimally against it
+            utilities[index] = max(child_utilities) if depth % 2 == 0 else min(child_utilities)
+        return utilities[0]
 
     def get_best_move(self):
-        """Returns the move corresponding to the child node with the highest utility."""
-        return max(self._children, key=lambda c: c.calculate_utility()).move
+        """Returns the move of the root leading to the child with the highest utility, see calculate_utility.
+
+        :returns list: Move, or None if the root has not been expanded or has no moves
+        """
+        if self._next_node == 0 or self._child_counts[0] == 0:
+            return None
+        first = self._first_children[0]
+        moves = self._root_board.legal_moves()
+        best = max(range(len(moves)), key=lambda i: self._utilities[self._children[first + i]])
+        return moves[best]
+
+    def memory_usage(self):
+        """Returns the number of bytes held by the arrays of the tree."""
+        arrays = (self._parents, self._node_moves, self._first_children, self._child_counts, self._utilities,
+                  self._children, self._table_keys, self._table_nodes)
+        return sum(a.itemsize * a.buffer_info()[1] for a in arrays)
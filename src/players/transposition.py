@@ -0,0 +1,105 @@
+import collections
+
+
+TableEntry = collections.namedtuple('TableEntry', ['key', 'depth', 'value', 'flag', 'move', 'generation'])
+
+
+class TranspositionTable:
+    """A bounded hash table of search results, keyed by the Zobrist hash of a position.
+
+    Any player can keep a TranspositionTable between calls to move and use it with CheckerBoard.zobrist_hash to avoid
+    searching the same position twice. The table has a fixed number of slots derived from its memory cap, and each
+    position can only be stored in the slot selected by its key. When two positions compete for a slot, the result
+    of the deeper search is kept, unless the stored entry is left over from an earlier search.
+    """
+    # Bound type of a stored value
+    EXACT = 0
+    LOWER_BOUND = 1
+    UPPER_BOUND = 2
+
+    # Approximate size of one stored entry: the slot pointer, the TableEntry tuple and its int values
+    ENTRY_BYTES = 200
+
+    def __init__(self, max_memory_mb=64):
+        """Inits a TranspositionTable with the specified parameters.
+
+        :param max_memory_mb: Approximate upper bound of the memory used by the table, in megabytes
+        :raises ValueError: if max_memory_mb is too small to hold a single entry
+        """
+        size = int(max_memory_mb * 1024 * 1024) // self.ENTRY_BYTES
+        if size < 1:
+            raise ValueError('Memory cap too small for a transposition table')
+        self._size = size
+        self._slots = [None] * size
+        self._generation = 0
+        self._count = 0
+        self.reset_stats()
+
+    def probe(self, key):
+        """Looks up the entry stored for a position.
+
+        :param key: Zobrist hash of the position
+        :returns TableEntry: Stored entry, or None if the position is not in the table
+        """
+        entry = self._slots[key % self._size]
+        if entry is None:
+            self._misses += 1
+            return None
+        if entry.key != key:
+            # Slot holds a different position
+            self._misses += 1
+            self._collisions += 1
+            return None
+        self._hits += 1
+        return entry
+
+    def store(self, key, depth, value, flag=EXACT, move=None):
+        """Stores the result of searching a position.
+
+        :param key: Zobrist hash of the position
+        :param depth: Depth the position was searched to
+        :param value: Value found by the search
+        :param flag: EXACT, LOWER_BOUND or UPPER_BOUND, describing how value bounds the true value
+        :param move: Best move found, if any
+        :returns bool: true if the entry was stored, false if a deeper result for another position was kept
+        """
+        index = key % self._size
+        entry = self._slots[index]
+        if entry is None:
+            self._count += 1
+        elif entry.key != key and entry.generation == self._generation and entry.depth > depth:
+            self._rejected += 1
+            return False
+        elif entry.key != key:
+            self._replaced += 1
+        self._slots[index] = TableEntry(key, depth, value, flag, move, self._generation)
+        self._stores += 1
+        return True
+
+    def new_search(self):
+        """Marks the entries stored so far as belonging to an earlier search, so they can be replaced first."""
+        self._generation += 1
+
+    def clear(self):
+        """Removes all entries from the table."""
+        self._slots = [None] * self._size
+        self._count = 0
+
+    def reset_stats(self):
+        """Resets the counters reported by get_stats."""
+        self._hits = self._misses = self._collisions = 0
+        self._stores = self._replaced = self._rejected = 0
+
+    def get_stats(self):
+        """Returns usage counters of the table.
+
+        :returns dict: hits and misses of probe, collisions (probes of a slot holding another position), stores,
+        replaced (entries overwritten by another position), rejected (stores refused in favor of a deeper entry),
+        entries, capacity and fill ratio
+        """
+        return {'hits': self._hits, 'misses': self._misses, 'collisions': self._collisions, 'stores': self._stores,
+                'replaced': self._replaced, 'rejected': self._rejected, 'entries': self._count,
+                'capacity': self._size, 'fill': self._count / self._size}
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,274 @@
+"""Batched game simulator, advancing many games in lockstep with NumPy.
+
+The state of all games is held in contiguous arrays: piece planes of shape (games, squares + 1) indexed by playable
+square (see game_log.square_index), with a last column which stands for off the board and is always empty of pieces
+and never empty to move to. Every rule is applied to all games at once with array operations, so the interpreter
+overhead is paid per batch instead of per game.
+
+Moves are chosen one hop at a time. An action is direction * squares + square, moving the piece on square one step,
+or jumping, in direction BoardGeometry.DIRECTIONS[direction]. After a jump which can be followed by another jump of
+the same piece, the same player chooses again: either a further jump of that piece, or STOP to end the move there.
+This covers exactly the moves of CheckerBoard.legal_moves, including forced capture, stopping a multiple jump early
+and a pawn promoted during a jump continuing as a king.
+"""
+from board import BoardGeometry, CheckerBoard, END_GAME_MOVE_LIMIT
+from game_log import square_index, square_location
+import numpy as np
+
+
+# Values of BatchSimulator.results
+ONGOING = 0
+WHITE_WINS = 1
+BLACK_WINS = 2
+DRAW = 3
+
+
+class BatchSimulator:
+    """A BatchSimulator plays many games of the same board size at once."""
+    def __init__(self, board_size, num_games):
+        """Inits a BatchSimulator with the specified parameters. All games start from the initial position.
+
+        :param board_size: Size of the square board to be used. Must be even and >= 4.
+        :param num_games: Number of games simulated together
+        :raises ValueError: if board_size is not an even number or less than 4
+        """
+        if not board_size % 2 == 0:
+            raise ValueError('Board size must be divisible by 2')
+        if board_size < 4:
+            raise ValueError("Board size must be at least 4")
+        n = board_size
+        squares = n * n // 2
+        self.board_size = n
+        self.num_games = num_games
+        self.squares = squares
+        self.STOP = 4 * squares
+        self.num_actions = 4 * squares + 1
+
+        # Square one step and two steps away in each direction, or the off board column
+        self._neighbors = np.full((4, squares), squares, dtype=np.intp)
+        self._jumps = np.full((4, squares), squares, dtype=np.intp)
+        for sq in range(squares):
+            row, col = square_location(sq, n)
+            for d, (dr, dc) in enumerate(BoardGeometry.DIRECTIONS):
+                if 0 <= row + dr < n and 0 <= col + dc < n:
+                    self._neighbors[d, sq] = square_index((row + dr, col + dc), n)
+                if 0 <= row + 2 * dr < n and 0 <= col + 2 * dc < n:
+                    self._jumps[d, sq] = square_index((row + 2 * dr, col + 2 * dc), n)
+        # Squares on which a pawn of each color is promoted
+        self._promotion = np.zeros((2, squares + 1), dtype=bool)
+        self._promotion[0, squares - n // 2:squares] = True
+        self._promotion[1, :n // 2] = True
+        # Whether pawns of each color move in each direction
+        self._pawn_directions = np.array([[True, True, False, False], [False, False, True, True]])
+        initial = CheckerBoard(n)
+        self._initial = np.zeros((2, squares + 1), dtype=bool)
+        for piece, loc in initial.get_pieces():
+            self._initial[0 if piece == 'w' else 1, square_index(loc, n)] = True
+
+        self.pieces = np.zeros((num_games, 2, squares + 1), dtype=bool)  # White and black pieces
+        self.kings = np.zeros((num_games, squares + 1), dtype=bool)
+        self.current_player = np.zeros(num_games, dtype=np.int8)  # 0 for white, 1 for black
+        self.end_game_move_count = np.zeros(num_games, dtype=np.int16)
+        self.moves = np.zeros(num_games, dtype=np.int32)  # Moves completed in each game
+        self.results = np.zeros(num_games, dtype=np.int8)
+        self._jumper = np.full(num_games, -1, dtype=np.intp)  # Square of the piece in the middle of a jump, or -1
+        self._reset_counter = np.zeros(num_games, dtype=bool)  # Whether the move so far captured or promoted
+        self._legal = None
+        self.reset()
+
+    def reset(self, games=None):
+        """Puts games back in the initial position.
+
+        :param games: Indices or boolean mask of the games to reset. All games if not provided.
+        """
+        if games is None:
+            games = slice(None)
+        self.pieces[games] = self._initial
+        self.kings[games] = False
+        self.current_player[games] = 0
+        self.end_game_move_count[games] = 0
+        self.moves[games] = 0
+        self.results[games] = ONGOING
+        self._jumper[games] = -1
+        self._reset_counter[games] = False
+        self._legal = None
+
+    def load(self, game, board):
+        """Sets the position of one game from a CheckerBoard."""
+        self.pieces[game] = False
+        self.kings[game] = False
+        for piece, loc in board.get_pieces():
+            sq = square_index(loc, self.board_size)
+            self.pieces[game, 0 if piece.lower() == 'w' else 1, sq] = True
+            self.kings[game, sq] = piece.isupper()
+        self.current_player[game] = 0 if board.current_player == 'w' else 1
+        self.end_game_move_count[game] = board.snapshot().end_game_move_count
+        self.moves[game] = 0
+        self._jumper[game] = -1
+        self._reset_counter[game] = False
+        self._legal = None
+        self.results[game] = ONGOING
+        self._update_results(np.array([game]))
+
+    def to_board(self, game):
+        """Returns a CheckerBoard with the position of one game.
+
+        In the middle of a multiple jump, the pieces are as after the last hop and the player is still to move.
+        """
+        pieces = []
+        for color, piece in ((0, 'w'), (1, 'b')):
+            for sq in np.flatnonzero(self.pieces[game, color, :self.squares]):
+                pieces.append((piece.upper() if self.kings[game, sq] else piece,
+                               square_location(int(sq), self.board_size)))
+        return CheckerBoard.from_pieces(self.board_size, pieces, 'w' if self.current_player[game] == 0 else 'b',
+                                        int(self.end_game_move_count[game]))
+
+    def decode_action(self, action, game):
+        """Returns the (from, to) locations of the hop made by action in a game, or None for STOP."""
+        if action == self.STOP:
+            return None
+        d, sq = divmod(int(action), self.squares)
+        player = self.current_player[game]
+        over = self._neighbors[d, sq]
+        to = self._jumps[d, sq] if self.pieces[game, 1 - player, over] else over
+        return square_location(sq, self.board_size), square_location(int(to), self.board_size)
+
+    def legal_actions(self):
+        """Returns which actions are legal in each game, all false for finished games.
+
+        :returns numpy.ndarray: Boolean array of shape (games, num_actions), which must not be modified
+        """
+        if self._legal is None:
+            self._legal = self._compute_legal()
+        return self._legal
+
+    def _compute_legal(self):
+        legal = np.zeros((self.num_games, self.num_actions), dtype=bool)
+        # Finished games have no legal actions, and are left out of the computation
+        games = np.flatnonzero(self.results == ONGOING)
+        if len(games) == 0:
+            return legal
+        squares = self.squares
+        black_to_move = (self.current_player[games] == 1)[:, None]
+        pieces = self.pieces[games]
+        white, black = pieces[:, 0], pieces[:, 1]
+        own = np.where(black_to_move, black, white)[:, :squares]
+        opponent = np.where(black_to_move, white, black)
+        empty = ~(white | black)
+        empty[:, squares] = False
+        kings = own & self.kings[games, :squares]
+        pawns = own & ~kings
+        steps = np.empty((len(games), 4, squares), dtype=bool)
+        jumps = np.empty((len(games), 4, squares), dtype=bool)
+        for d in range(4):
+            pawn_direction = np.where(black_to_move, self._pawn_directions[1, d], self._pawn_directions[0, d])
+            movers = kings | (pawns & pawn_direction)
+            steps[:, d] = movers & empty[:, self._neighbors[d]]
+            jumps[:, d] = movers & opponent[:, self._neighbors[d]] & empty[:, self._jumps[d]]
+        jumper = self._jumper[games]
+        jumping = jumper >= 0
+        if jumping.any():
+            # Only the piece in the middle of a jump can move, and only by jumping
+            jumps[jumping] &= (np.arange(squares) == jumper[jumping, None])[:, None, :]
+        # Forced capture
+        steps[jumps.any(axis=(1, 2)) | jumping] = False
+        legal[games, :self.STOP] = (steps | jumps).reshape(len(games), -1)
+        legal[games, self.STOP] = jumping
+        return legal
+
+    def random_actions(self, rng=None):
+        """Returns a uniformly random legal action for each game, -1 for finished games.
+
+        :param rng: numpy.random.Generator to use, a new one if not provided
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        games, legal_actions = np.nonzero(self.legal_actions())
+        # The legal actions of each game are contiguous in legal_actions, pick one at random in each run
+        counts = np.bincount(games, minlength=self.num_games)
+        starts = np.cumsum(counts) - counts
+        actions = np.full(self.num_games, -1, dtype=np.intp)
+        playing = counts > 0
+        picks = starts[playing] + (rng.random(np.count_nonzero(playing)) * counts[playing]).astype(np.intp)
+        actions[playing] = legal_actions[picks]
+        return actions
+
+    def step(self, actions):
+        """Makes one hop, or STOP, in every game. The actions are not validated.
+
+        :param actions: Array of one legal action per game, or -1 for games which should not move
+        :returns tuple: Boolean array of the games whose move ended with this action, and the results array with
+        ONGOING, WHITE_WINS, BLACK_WINS or DRAW for each game
+        """
+        actions = np.asarray(actions)
+        games = np.flatnonzero((actions >= 0) & (self.results == ONGOING))
+        actions = actions[games]
+        ended = np.zeros(self.num_games, dtype=bool)
+
+        stops = actions == self.STOP
+        ended[games[stops]] = True
+        games, actions = games[~stops], actions[~stops]
+        d, sq = np.divmod(actions, self.squares)
+        player = self.current_player[games].astype(np.intp)
+        opponent = 1 - player
+        over = self._neighbors[d, sq]
+        is_jump = self.pieces[games, opponent, over]
+        to = np.where(is_jump, self._jumps[d, sq], over)
+
+        self.pieces[games, player, sq] = False
+        self.pieces[games, player, to] = True
+        was_king = self.kings[games, sq]
+        promoted = ~was_king & self._promotion[player, to]
+        self.kings[games, sq] = False
+        self.kings[games, to] = was_king | promoted
+        captured_games, captured_squares = games[is_jump], over[is_jump]
+        self.pieces[captured_games, opponent[is_jump], captured_squares] = False
+        self.kings[captured_games, captured_squares] = False
+        self._reset_counter[games] |= is_jump | promoted
+
+        # A jump continues if the piece can jump again from where it landed
+        can_continue = np.zeros(len(games), dtype=bool)
+        if is_jump.any():
+            jump_games, jump_to = games[is_jump], to[is_jump]
+            jump_player, jump_opponent = player[is_jump], opponent[is_jump]
+            king = self.kings[jump_games, jump_to]
+            empty = ~(self.pieces[jump_games, 0] | self.pieces[jump_games, 1])
+            empty[:, self.squares] = False
+            rows = np.arange(len(jump_games))
+            found = np.zeros(len(jump_games), dtype=bool)
+            for direction in range(4):
+                neighbors = self._neighbors[direction, jump_to]
+                found |= ((king | self._pawn_directions[jump_player, direction]) &
+                          self.pieces[jump_games, jump_opponent, neighbors] &
+                          empty[rows, self._jumps[direction, jump_to]])
+            can_continue[is_jump] = found
+        self._jumper[games[can_continue]] = to[can_continue]
+        ended[games[~can_continue]] = True
+
+        # End the moves of the players who are done
+        ended_games = np.flatnonzero(ended)
+        self._jumper[ended_games] = -1
+        self.current_player[ended_games] ^= 1
+        self.end_game_move_count[ended_games] = np.where(self._reset_counter[ended_games], 0,
+                                                         self.end_game_move_count[ended_games] + 1)
+        self._reset_counter[ended_games] = False
+        self.moves[ended_games] += 1
+        self._legal = None
+        self._update_results(ended_games)
+        return ended, self.results
+
+    def _update_results(self, games):
+        """Checks for the end of the games, as CheckerBoard.get_winner does."""
+        legal = self.legal_actions()
+        no_moves = games[~legal[games].any(axis=1)]
+        self.results[no_moves] = np.where(self.current_player[no_moves] == 0, BLACK_WINS, WHITE_WINS)
+        limit = games[(self.end_game_move_count[games] == END_GAME_MOVE_LIMIT) & (self.results[games] == ONGOING)]
+        if len(limit) > 0:
+            counts = self.pieces[limit].sum(axis=2)
+            self.results[limit] = np.where(counts[:, 0] > counts[:, 1], WHITE_WINS,
+                                           np.where(counts[:, 1] > counts[:, 0], BLACK_WINS, DRAW))
+        # Finished games have no legal actions
+        legal[limit] = False
+
+    def count_results(self):
+        """Returns the number of games ongoing, won by white, won by black and drawn, in that order."""
+        return np.bincount(self.results, minlength=4)
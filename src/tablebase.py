@@ -0,0 +1,373 @@
+"""Endgame tablebases for positions with few pieces.
+
+A tablebase stores, for every position with at most a given number of pieces, whether the player to move wins, loses
+or draws with perfect play, and the number of moves (plies) until the game ends. Tablebases are generated by
+retrograde analysis: positions without moves are lost, and results are propagated backwards to the positions which
+can reach them, shortest wins and longest losses first. Positions whose result is never decided are draws.
+
+Positions are grouped into slices by their material: the number of white pawns, white kings, black pawns and black
+kings. Captures and promotions always lead to a slice solved earlier, so slices are solved in order of total pieces
+and then pawns, and slices of the same order are solved in parallel. Each slice is written to its own file as soon as
+it is solved, and slices whose file exists are skipped, so an interrupted generation can be resumed.
+
+A slice file has a 24 byte header (the magic bytes b'CKTB', the board size, the four piece counts and the number of
+entries) followed by one little endian uint16 per position: the result in the low 2 bits and the distance above.
+
+The 40 move end game rule is not taken into account: results assume the game is played until one player can not move.
+
+Usage from the src directory:
+
+    python tablebase.py tablebases --board-size 8 --max-pieces 4
+"""
+from board import CheckerBoard
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from math import comb
+import argparse
+import array
+import collections
+import mmap
+import os
+import struct
+import sys
+import time
+
+
+# Results, from the point of view of the player to move
+DRAW = 0
+WIN = 1
+LOSS = 2
+
+MAGIC = b'CKTB'
+_HEADER = struct.Struct('<4sBBBBB3xQ')
+_ENTRY = struct.Struct('<H')
+_MAX_DISTANCE = 0x3FFF
+
+TablebaseResult = collections.namedtuple('TablebaseResult', ['result', 'distance'])
+TablebaseResult.__doc__ = """Value of a position: DRAW, WIN or LOSS for the player to move, and the number of plies
+until the game ends with perfect play, 0 for draws."""
+
+
+def slice_path(directory, board_size, signature):
+    """Returns the file holding the slice with signature (white pawns, white kings, black pawns, black kings)."""
+    return os.path.join(directory, 'tb{}_{}.cktb'.format(board_size, '-'.join(str(count) for count in signature)))
+
+
+def get_signature(white, black, kings):
+    """Returns the material signature (white pawns, white kings, black pawns, black kings) of bitboards."""
+    white_kings = bin(white & kings).count('1')
+    black_kings = bin(black & kings).count('1')
+    return bin(white).count('1') - white_kings, white_kings, bin(black).count('1') - black_kings, black_kings
+
+
+def slice_size(board_size, signature):
+    """Returns the number of entries of a slice: both players to move for every placement of the pieces."""
+    free = board_size * board_size // 2
+    size = 2
+    for count in signature:
+        size *= comb(free, count)
+        free -= count
+    return size
+
+
+def position_index(board_size, white, black, kings, black_to_move, signature):
+    """Returns the index of a position within its slice.
+
+    Each group of pieces (white pawns, white kings, black pawns, black kings) is ranked as a combination of the playable
+    squares not taken by the previous groups, and the ranks are combined in mixed radix, with the player to move as
+    the last digit. The bit index of a playable square divided by 2 numbers the playable squares row by row.
+    """
+    groups = (white & ~kings, white & kings, black & ~kings, black & kings)
+    free = board_size * board_size // 2
+    taken = 0
+    index = 0
+    for group, count in zip(groups, signature):
+        rank = 0
+        i = 1
+        bb = group
+        while bb:
+            low = bb & -bb
+            bb ^= low
+            rank += comb((low.bit_length() - 1) // 2 - bin(taken & (low - 1)).count('1'), i)
+            i += 1
+        index = index * comb(free, count) + rank
+        free -= count
+        taken |= group
+    return 2 * index + (1 if black_to_move else 0)
+
+
+def all_signatures(max_pieces):
+    """Returns the signatures of all slices with 1 to max_pieces pieces, in the order they must be solved."""
+    signatures = [(wp, wk, bp, bk)
+                  for total in range(1, max_pieces + 1)
+                  for wp in range(total + 1) for wk in range(total + 1 - wp) for bp in range(total + 1 - wp - wk)
+                  for bk in (total - wp - wk - bp,)]
+    return sorted(signatures, key=_level)
+
+
+def _level(signature):
+    """Slices only depend on slices of a lower level: fewer pieces, or as many pieces and fewer pawns."""
+    return sum(signature), signature[0] + signature[2]
+
+
+class Tablebase:
+    """A Tablebase probes the slice files of one board size found in a directory.
+
+    Slice files are memory-mapped when first needed, so creating a Tablebase is cheap and probing a position costs a
+    few integer operations and one read from the mapped file.
+    """
+    DRAW = DRAW
+    WIN = WIN
+    LOSS = LOSS
+
+    def __init__(self, directory, board_size):
+        """Inits a Tablebase with the specified parameters.
+
+        :param directory: Directory holding the slice files
+        :param board_size: Size of the board the tablebase was generated for
+        """
+        self._directory = directory
+        self._board_size = board_size
+        self._slices = {}  # Memory-mapped slice files by signature, None if the file does not exist
+        self.max_pieces = 0
+        prefix = 'tb{}_'.format(board_size)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.startswith(prefix) and name.endswith('.cktb'):
+                    signature = tuple(int(count) for count in name[len(prefix):-len('.cktb')].split('-'))
+                    self.max_pieces = max(self.max_pieces, sum(signature))
+
+    def _get_slice(self, signature):
+        if signature not in self._slices:
+            path = slice_path(self._directory, self._board_size, signature)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    self._slices[signature] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._slices[signature] = None
+        return self._slices[signature]
+
+    def probe_bitboards(self, white, black, kings, black_to_move):
+        """Looks up a position given as bitboards, see probe."""
+        signature = get_signature(white, black, kings)
+        if sum(signature) > self.max_pieces:
+            return None
+        data = self._get_slice(signature)
+        if data is None:
+            return None
+        index = position_index(self._board_size, white, black, kings, black_to_move, signature)
+        value = _ENTRY.unpack_from(data, _HEADER.size + _ENTRY.size * index)[0]
+        return TablebaseResult(value & 3, value >> 2)
+
+    def probe(self, board):
+        """Looks up the value of a position.
+
+        :param board: CheckerBoard or BoardSnapshot with the position
+        :returns TablebaseResult: Result for the player to move, or None if the position is not in the tablebase
+        """
+        white, black, kings = board.get_bitboards()
+        return self.probe_bitboards(white, black, kings, board.current_player == 'b')
+
+    def best_move(self, board):
+        """Returns a move which keeps the best result for the player to move.
+
+        Wins are played by the shortest path, losses are delayed as long as possible.
+
+        :param board: CheckerBoard or BoardSnapshot with the position
+        :returns list: Move, or None if the position is not in the tablebase
+        """
+        if self.probe(board) is None:
+            return None
+        board = board.copy()
+        best_move = None
+        best_key = None
+        for move in board.legal_moves():
+            record = board.apply_move(move)
+            child = self.probe(board)
+            board.undo_move(record)
+            if child is None:
+                return None
+            # Rank moves by the result for the player to move: opponent loss first, quickest win first
+            if child.result == LOSS:
+                key = (2, -child.distance)
+            elif child.result == DRAW:
+                key = (1, 0)
+            else:
+                key = (0, child.distance)
+            if best_key is None or key > best_key:
+                best_move, best_key = move, key
+        return best_move
+
+    def close(self):
+        for data in self._slices.values():
+            if data is not None:
+                data.close()
+        self._slices = {}
+
+
+def _placements(board_size, signature):
+    """Yields the (white, black, kings) bitboards of every placement of the pieces of a slice."""
+    half = board_size // 2
+    bits = [1 << (2 * p + (1 - (p // half) % 2)) for p in range(board_size * half)]
+
+    def place(free, chosen):
+        if len(chosen) == len(signature):
+            white_pawns, white_kings, black_pawns, black_kings = chosen
+            yield white_pawns | white_kings, black_pawns | black_kings, white_kings | black_kings
+            return
+        count = signature[len(chosen)]
+        for squares in combinations(free, count):
+            remaining = [p for p in free if p not in squares]
+            yield from place(remaining, chosen + [sum(bits[p] for p in squares)])
+
+    yield from place(list(range(len(bits))), [])
+
+
+def solve_slice(directory, board_size, signature):
+    """Solves one slice by retrograde analysis and writes its file. Lower level slices must already exist.
+
+    :returns tuple: The signature and the number of positions solved
+    """
+    path = slice_path(directory, board_size, signature)
+    size = slice_size(board_size, signature)
+    tablebase = Tablebase(directory, board_size)
+    tablebase.max_pieces = sum(signature)
+    # Per position: number of moves within the slice not known to win for the opponent, whether the position can not
+    # be lost (a move leads to a draw or a win in a lower slice), and the longest loss found so far
+    remaining = array.array('H', bytes(2 * size))
+    cannot_lose = bytearray(size)
+    loss_distance = array.array('H', bytes(2 * size))
+    edge_child = array.array('I')
+    edge_parent = array.array('I')
+    buckets = collections.defaultdict(list)
+
+    for white, black, kings in _placements(board_size, signature):
+        for black_to_move in (False, True):
+            index = position_index(board_size, white, black, kings, black_to_move, signature)
+            board = CheckerBoard.from_bitboards(board_size, white, black, kings, 'b' if black_to_move else 'w')
+            moves = board.legal_moves()
+            if len(moves) == 0:
+                buckets[0].append((index, LOSS))
+                continue
+            win_distance = None
+            for move in moves:
+                record = board.apply_move(move)
+                child_white, child_black, child_kings = board.get_bitboards()
+                child_signature = get_signature(child_white, child_black, child_kings)
+                if child_signature == signature:
+                    edge_child.append(position_index(board_size, child_white, child_black, child_kings,
+                                                     not black_to_move, signature))
+                    edge_parent.append(index)
+                    remaining[index] += 1
+                else:
+                    child = tablebase.probe_bitboards(child_white, child_black, child_kings, not black_to_move)
+                    if child.result == LOSS:
+                        if win_distance is None or child.distance + 1 < win_distance:
+                            win_distance = child.distance + 1
+                    elif child.result == DRAW:
+                        cannot_lose[index] = 1
+                    else:
+                        loss_distance[index] = max(loss_distance[index], child.distance + 1)
+                board.undo_move(record)
+            if win_distance is not None:
+                cannot_lose[index] = 1
+                buckets[win_distance].append((index, WIN))
+            elif remaining[index] == 0 and not cannot_lose[index]:
+                # Every move leads to a lower slice position won by the opponent
+                buckets[loss_distance[index]].append((index, LOSS))
+    tablebase.close()
+
+    # Group the edges by child, so the parents of a position can be found when it is solved
+    offsets = array.array('I', bytes(4 * (size + 1)))
+    for child in edge_child:
+        offsets[child + 1] += 1
+    for i in range(size):
+        offsets[i + 1] += offsets[i]
+    parents = array.array('I', bytes(4 * len(edge_child)))
+    fill = offsets[:size]
+    for child, parent in zip(edge_child, edge_parent):
+        parents[fill[child]] = parent
+        fill[child] += 1
+    del edge_child, edge_parent, fill
+
+    # Propagate results backwards, in order of distance
+    values = array.array('H', bytes(2 * size))
+    solved = bytearray(size)
+    distance = 0
+    while buckets:
+        if distance not in buckets:
+            distance += 1
+            continue
+        for index, result in buckets.pop(distance):
+            if solved[index]:
+                continue
+            solved[index] = 1
+            values[index] = min(distance, _MAX_DISTANCE) << 2 | result
+            for parent in parents[offsets[index]:offsets[index + 1]]:
+                if solved[parent]:
+                    continue
+                if result == LOSS:
+                    buckets[distance + 1].append((parent, WIN))
+                else:
+                    remaining[parent] -= 1
+                    loss_distance[parent] = max(loss_distance[parent], distance + 1)
+                    if remaining[parent] == 0 and not cannot_lose[parent]:
+                        buckets[loss_distance[parent]].append((parent, LOSS))
+        distance += 1
+
+    if sys.byteorder == 'big':
+        values.byteswap()
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, board_size, *signature, size))
+        f.write(values.tobytes())
+    # Rename when complete, so a slice file always holds a solved slice
+    os.replace(temp_path, path)
+    return signature, size
+
+
+def generate(directory, board_size, max_pieces, workers=None):
+    """Generates all slices with up to max_pieces pieces, skipping slices already on disk.
+
+    Slices of the same level are solved in parallel, in a pool of worker processes.
+
+    :param directory: Directory to write the slice files to. Created if needed.
+    :param board_size: Size of the board. Must be even and >= 4.
+    :param max_pieces: Maximum total number of pieces
+    :param workers: Number of worker processes. Defaults to the number of cpus.
+    :returns generator: Yields (signature, positions, seconds) as each slice is solved
+    :raises ValueError: if board_size is not an even number or less than 4
+    """
+    if not board_size % 2 == 0:
+        raise ValueError('Board size must be divisible by 2')
+    if board_size < 4:
+        raise ValueError("Board size must be at least 4")
+    os.makedirs(directory, exist_ok=True)
+    levels = collections.OrderedDict()
+    for signature in all_signatures(max_pieces):
+        levels.setdefault(_level(signature), []).append(signature)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for signatures in levels.values():
+            pending = [s for s in signatures if not os.path.exists(slice_path(directory, board_size, s))]
+            start_time = time.perf_counter()
+            futures = [executor.submit(solve_slice, directory, board_size, s) for s in pending]
+            for future in futures:
+                signature, size = future.result()
+                yield signature, size, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases.')
+    parser.add_argument('directory', help='directory to write the tablebase files to')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--max-pieces', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    for signature, size, seconds in generate(args.directory, args.board_size, args.max_pieces, args.workers):
+        print('Solved {} ({} positions) in {:.1f}s'.format('-'.join(str(count) for count in signature), size,
+                                                           seconds))
+
+
+if __name__ == '__main__':
+    main()
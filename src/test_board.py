@@ -0,0 +1,21 @@
+from board import BoardSnapshot, CheckerBoard
+import copy
+import pickle
+
+
+def test_snapshot_pickle_round_trip():
+    board = CheckerBoard(8)
+    board.apply_move(board.legal_moves()[0])
+    snapshot = board.snapshot()
+    snapshot.legal_moves()  # Creates the private CheckerBoard, which is not pickled
+    restored = pickle.loads(pickle.dumps(snapshot))
+    assert isinstance(restored, BoardSnapshot)
+    assert restored == snapshot
+    assert hash(restored) == hash(snapshot)
+    assert restored.legal_moves() == snapshot.legal_moves()
+
+
+def test_snapshot_deepcopy_returns_snapshot():
+    snapshot = CheckerBoard(8).snapshot()
+    assert copy.deepcopy(snapshot) is snapshot
+    assert copy.deepcopy({snapshot: [snapshot]}) == {snapshot: [snapshot]}
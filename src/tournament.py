@@ -0,0 +1,395 @@
+"""Headless tournament runner for bot vs bot games.
+
+Games are played without any console or gui output, concurrently in a pool of worker processes. Each pairing of
+players plays one game with each color. Results are yielded as soon as each game completes, and the Tournament keeps
+standings and per player move timing which can be printed at any point.
+"""
+from board import CheckerBoard
+from game_log import GameRecorder, GameWriter
+from instrumentation import Instrumentation, PLAYER_MOVE
+from player_host import PlayerHost
+from players.interface import AbstractPlayer
+from players.mcts import set_default_workers
+from players.simple_ai import SimpleAI, AlphaBetaAI
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from threading import Thread
+from random import choice, Random
+import argparse
+import collections
+import os
+import pstats
+import time
+
+
+GameResult = collections.namedtuple('GameResult', ['game_id', 'white', 'black', 'winner', 'moves', 'invalid_moves',
+                                                   'white_times', 'black_times', 'duration', 'record', 'stats'])
+GameResult.__doc__ = """Outcome of one game.
+
+white and black are indices into the list of player classes, winner is 'w', 'b' or 'd', invalid_moves is a (white,
+black) tuple counting the moves of each player replaced by a random move, and white_times and black_times list the
+seconds each player took per move. record is the packed game record (see game_log) if the moves were recorded, None
+otherwise. stats holds the CallStats of the instrumented functions by name (see instrumentation) if the game was
+instrumented, None otherwise.
+"""
+
+
+def play_game(board_size, time_limit, white_class, black_class, game_id=0, isolate_players=False,
+              record_moves=False, player_ids=(0, 1), opening=None, instrumentation=None):
+    """Plays one game between two players without any output.
+
+    As in board.main, a random valid move is played if a player does not provide a valid move within time_limit. A
+    player whose PlayerHost can not be restarted after exceeding its time limit forfeits the game, and this is counted
+    as an invalid move.
+    Players either run in a separate thread per move, as in board.main, or each in its own PlayerHost worker process
+    which is restarted if the player exceeds its time limit. Players which have a close method, such as MCTSPlayer,
+    are closed when the game ends.
+
+    :param board_size: Size of the square board to be used. Must be even and >= 4.
+    :param time_limit: Time in seconds each player has to act
+    :param white_class: Class to initialize the white player from
+    :param black_class: Class to initialize the black player from
+    :param game_id: Identifier reported in the result
+    :param isolate_players: Whether to run the players in worker processes
+    :param record_moves: Whether to return the moves as a packed game record
+    :param player_ids: Ids of the white and black player stored in the game record
+    :param opening: List of valid moves played before the players take over, eg, to vary self-play games. They are
+    recorded and counted in the number of moves, with no time taken.
+    :param instrumentation: Instrumentation enabled for the duration of the game. The player moves are recorded as
+    measured in their thread, or as the latency of the PlayerHost requests if isolate_players is set, in which case
+    the board methods called by the players are not instrumented since they run in other processes.
+    :returns GameResult: Result of the game, with player indices 0 for white and 1 for black
+    """
+    start_time = time.perf_counter()
+    cb = CheckerBoard(board_size)
+    players = []
+    times = [[], []]
+    invalid_moves = [0, 0]
+    recorder = GameRecorder(board_size, *player_ids) if record_moves else None
+    move_ind = 0
+    try:
+        for player_class, player_num in ((white_class, 1), (black_class, 2)):
+            if isolate_players:
+                players.append(PlayerHost(player_class, board_size, player_num))
+            else:
+                players.append(player_class(board_size, player_num))
+                if instrumentation is not None:
+                    instrumentation.wrap_player(players[-1])
+        if instrumentation is not None:
+            instrumentation.enable()
+        for move in opening or []:
+            cb.apply_move(move)
+            if recorder is not None:
+                recorder.add_move(move)
+            move_ind += 1
+        winner = cb.get_winner()
+        while not winner:
+            player = players[move_ind % 2]
+            move_start = time.perf_counter()
+            if isolate_players:
+                try:
+                    move = player.move(cb, time_limit)
+                except RuntimeError:
+                    # The worker could not be restarted, the player forfeits
+                    times[move_ind % 2].append(time.perf_counter() - move_start)
+                    invalid_moves[move_ind % 2] += 1
+                    winner = 'b' if move_ind % 2 == 0 else 'w'
+                    break
+                if instrumentation is not None:
+                    instrumentation.record(PLAYER_MOVE, time.perf_counter() - move_start)
+            else:
+                move = []  # list representing move returned from player
+                t = Thread(target=player.move, args=(cb.snapshot(), time_limit, move), daemon=True)
+                t.start()
+                t.join(time_limit)
+            times[move_ind % 2].append(time.perf_counter() - move_start)
+            move = list(move)
+            if not cb.execute_move(move):
+                invalid_moves[move_ind % 2] += 1
+                move = choice(cb.legal_moves())
+                cb.execute_move(move)
+            if recorder is not None:
+                recorder.add_move(move, times[move_ind % 2][-1])
+            move_ind += 1
+            winner = cb.get_winner()
+    finally:
+        if instrumentation is not None:
+            instrumentation.disable()
+        for player in players:
+            # Stops the worker processes of players such as MCTSPlayer, or of the PlayerHost
+            if hasattr(player, 'close'):
+                player.close()
+    return GameResult(game_id, 0, 1, winner, move_ind, tuple(invalid_moves), times[0], times[1],
+                      time.perf_counter() - start_time, recorder.finish(winner) if recorder is not None else None,
+                      instrumentation.get_stats() if instrumentation is not None else None)
+
+
+def game_pool(workers=None):
+    """Returns a ProcessPoolExecutor for playing games concurrently.
+
+    Players which search in parallel, such as MCTSPlayer, share the cpus left per player: with workers games running
+    at once, each player of a game defaults to cpu_count // (2 * workers) parallel searches, at least one.
+
+    :param workers: Number of worker processes, defaults to the number of cpus
+    """
+    workers = workers or os.cpu_count() or 1
+    return ProcessPoolExecutor(max_workers=workers, initializer=set_default_workers,
+                               initargs=(max((os.cpu_count() or 1) // (2 * workers), 1),))
+
+
+def _play_pairing(board_size, time_limit, player_classes, game_id, white, black, isolate_players, record_moves,
+                  instrument, profile_dir, track_allocations):
+    """Worker process entry point, plays one game between two players of the tournament."""
+    instrumentation = (Instrumentation(track_allocations=track_allocations, profile=profile_dir is not None)
+                       if instrument else None)
+    result = play_game(board_size, time_limit, player_classes[white], player_classes[black], game_id,
+                       isolate_players, record_moves, (white, black), instrumentation=instrumentation)
+    if profile_dir is not None:
+        instrumentation.dump_profile(os.path.join(profile_dir, 'game-{}.prof'.format(game_id)))
+    return result._replace(white=white, black=black)
+
+
+class Tournament:
+    """A Tournament plays games between a list of players concurrently and keeps the standings."""
+    ROUND_ROBIN = 'round_robin'
+    SWISS = 'swiss'
+
+    def __init__(self, player_classes, board_size, time_limit, workers=None, isolate_players=True, log_path=None,
+                 instrument=False, profile_dir=None, track_allocations=False):
+        """Inits a Tournament with the specified parameters.
+
+        :param player_classes: List of at least two classes implementing AbstractPlayer. A class may be listed more
+        than once. Classes must be defined at module level so they can be sent to the worker processes.
+        :param board_size: Size of the square board to be used. Must be even and >= 4.
+        :param time_limit: Time in seconds each player has to act
+        :param workers: Number of worker processes. Defaults to the number of cpus.
+        :param isolate_players: Whether to run each player in its own process with a hard time limit, see PlayerHost
+        :param log_path: File to append the game records to, see game_log. Player ids in the records are the indices
+        in player_classes. Games are not recorded if not provided.
+        :param instrument: Whether to instrument every game and aggregate the statistics, see get_call_stats
+        :param profile_dir: Directory to write a cProfile dump of every game to, and of the whole tournament when it
+        completes. Implies instrument.
+        :param track_allocations: Whether to also record the memory allocated by the instrumented calls, see
+        Instrumentation. Implies instrument.
+        :raises TypeError: if a player class is not a subclass of AbstractPlayer
+        :raises ValueError: if board_size is not an even number or less than 4, or there are less than two players
+        """
+        for player_class in player_classes:
+            if not issubclass(player_class, AbstractPlayer):
+                raise TypeError('{} did not implement AbstractPlayer'.format(player_class.__name__))
+        if len(player_classes) < 2:
+            raise ValueError('A tournament needs at least two players')
+        if not board_size % 2 == 0:
+            raise ValueError('Board size must be divisible by 2')
+        if board_size < 4:
+            raise ValueError("Board size must be at least 4")
+
+        self._player_classes = list(player_classes)
+        self._names = [self._display_name(i) for i in range(len(self._player_classes))]
+        self._board_size = board_size
+        self._time_limit = time_limit
+        self._workers = workers or os.cpu_count() or 1
+        self._isolate_players = isolate_players
+        self._log_path = log_path
+        self._instrument = instrument or profile_dir is not None or track_allocations
+        self._profile_dir = profile_dir
+        self._track_allocations = track_allocations
+        self._call_stats = Instrumentation()
+        self._results = []
+        self._byes = [0] * len(self._player_classes)
+        self._start_time = None
+        self._end_time = None
+
+    def _display_name(self, index):
+        name = self._player_classes[index].__name__
+        if self._player_classes.count(self._player_classes[index]) > 1:
+            name += '#{}'.format(self._player_classes[:index + 1].count(self._player_classes[index]))
+        return name
+
+    def run(self, pairing=ROUND_ROBIN, rounds=1, seed=None):
+        """Plays the tournament, yielding each GameResult as soon as the game completes.
+
+        With ROUND_ROBIN, every pair of players plays a game with each color, rounds times. With SWISS, each round
+        pairs players with similar scores who have not met yet, and each pairing plays a game with each color. When
+        the number of players is odd, one player per Swiss round sits out and receives a point.
+
+        :param pairing: ROUND_ROBIN or SWISS
+        :param rounds: Number of rounds to play
+        :param seed: Seed for breaking ties between equal scores in Swiss pairings
+        :raises ValueError: if pairing is not a known pairing system
+        """
+        if pairing not in (self.ROUND_ROBIN, self.SWISS):
+            raise ValueError('Unknown pairing system {}'.format(pairing))
+        self._start_time = time.perf_counter()
+        writer = GameWriter(self._log_path) if self._log_path is not None else None
+        if self._profile_dir is not None:
+            os.makedirs(self._profile_dir, exist_ok=True)
+        try:
+            yield from self._run(pairing, rounds, seed, writer)
+        finally:
+            if writer is not None:
+                writer.close()
+        self._end_time = time.perf_counter()
+        if self._profile_dir is not None:
+            self._dump_profile()
+
+    def _run(self, pairing, rounds, seed, writer):
+        with game_pool(self._workers) as executor:
+            if pairing == self.ROUND_ROBIN:
+                # All games are known in advance, so submit them at once to keep every worker busy
+                pairs = [(white, black) for _ in range(rounds)
+                         for white in range(len(self._player_classes))
+                         for black in range(len(self._player_classes)) if white != black]
+                yield from self._play(executor, pairs, writer)
+            else:
+                rng = Random(seed)
+                for _ in range(rounds):
+                    pairs = []
+                    for first, second in self._swiss_pairs(rng):
+                        pairs.extend([(first, second), (second, first)])
+                    yield from self._play(executor, pairs, writer)
+
+    def _play(self, executor, pairs, writer):
+        futures = [executor.submit(_play_pairing, self._board_size, self._time_limit, self._player_classes,
+                                   len(self._results) + i, white, black, self._isolate_players, writer is not None,
+                                   self._instrument, self._profile_dir, self._track_allocations)
+                   for i, (white, black) in enumerate(pairs)]
+        for future in as_completed(futures):
+            result = future.result()
+            if writer is not None:
+                writer.write(result.record)
+                # The record is on disk, no need to keep it in memory
+                result = result._replace(record=None)
+            if result.stats is not None:
+                self._call_stats.merge(result.stats)
+                result = result._replace(stats=None)
+            self._results.append(result)
+            yield result
+
+    def _swiss_pairs(self, rng):
+        """Pairs players by score for the next Swiss round, avoiding rematches where possible."""
+        scores = self.get_scores()
+        played = {(r.white, r.black) for r in self._results} | {(r.black, r.white) for r in self._results}
+        order = sorted(range(len(self._player_classes)), key=lambda i: (-scores[i], rng.random()))
+        if len(order) % 2 == 1:
+            # The lowest ranked player with the fewest byes sits out this round
+            bye = min(reversed(order), key=lambda i: self._byes[i])
+            order.remove(bye)
+            self._byes[bye] += 1
+        pairs = []
+        while order:
+            first = order.pop(0)
+            opponent = next((i for i in order if (first, i) not in played), order[0])
+            order.remove(opponent)
+            pairs.append((first, opponent))
+        return pairs
+
+    def get_player_name(self, index):
+        """Returns the display name of the player at index in the list of player classes."""
+        return self._names[index]
+
+    def get_results(self):
+        """Returns the list of GameResults of the games completed so far, in order of completion."""
+        return list(self._results)
+
+    def get_scores(self):
+        """Returns the score of each player: 1 point per win or bye, and half a point per draw."""
+        scores = [float(byes) for byes in self._byes]
+        for result in self._results:
+            if result.winner == 'd':
+                scores[result.white] += 0.5
+                scores[result.black] += 0.5
+            else:
+                scores[result.white if result.winner == 'w' else result.black] += 1
+        return scores
+
+    def get_stats(self):
+        """Returns the standings and timing of each player, best score first.
+
+        :returns list: List of dicts with the player name, score, wins, draws, losses, games, moves, invalid moves, and
+        the mean and maximum seconds per move.
+        """
+        stats = [{'name': name, 'score': score, 'wins': 0, 'draws': 0, 'losses': 0, 'games': 0, 'moves': 0,
+                  'invalid_moves': 0, 'mean_move_time': 0.0, 'max_move_time': 0.0}
+                 for name, score in zip(self._names, self.get_scores())]
+        total_time = [0.0] * len(stats)
+        for result in self._results:
+            for index, color, times, invalid_moves in (
+                    (result.white, 'w', result.white_times, result.invalid_moves[0]),
+                    (result.black, 'b', result.black_times, result.invalid_moves[1])):
+                player = stats[index]
+                player['games'] += 1
+                if result.winner == 'd':
+                    player['draws'] += 1
+                elif result.winner == color:
+                    player['wins'] += 1
+                else:
+                    player['losses'] += 1
+                player['moves'] += len(times)
+                total_time[index] += sum(times)
+                player['max_move_time'] = max([player['max_move_time']] + times)
+                player['invalid_moves'] += invalid_moves
+        for player, seconds in zip(stats, total_time):
+            if player['moves'] > 0:
+                player['mean_move_time'] = seconds / player['moves']
+        return sorted(stats, key=lambda player: -player['score'])
+
+    def get_call_stats(self):
+        """Returns the instrumentation statistics of all games completed so far, see Instrumentation.report."""
+        return self._call_stats.report()
+
+    def _dump_profile(self):
+        """Combines the profiles of all games into tournament.prof in the profile directory."""
+        paths = [os.path.join(self._profile_dir, 'game-{}.prof'.format(result.game_id)) for result in self._results]
+        paths = [path for path in paths if os.path.exists(path)]
+        if len(paths) > 0:
+            pstats.Stats(*paths).dump_stats(os.path.join(self._profile_dir, 'tournament.prof'))
+
+    def get_games_per_second(self):
+        """Returns the number of games completed per second of wall time since the tournament started."""
+        if self._start_time is None:
+            return 0.0
+        elapsed = (self._end_time or time.perf_counter()) - self._start_time
+        return len(self._results) / elapsed if elapsed > 0 else 0.0
+
+    def print_report(self):
+        """Prints the standings, per player timing and throughput to the console"""
+        print('{:<24} {:>6} {:>4} {:>4} {:>4} {:>7} {:>10} {:>10}'.format('player', 'score', 'W', 'D', 'L', 'moves',
+                                                                          'mean (ms)', 'max (ms)'))
+        for player in self.get_stats():
+            print('{:<24} {:>6.1f} {:>4} {:>4} {:>4} {:>7} {:>10.1f} {:>10.1f}'.format(
+                player['name'], player['score'], player['wins'], player['draws'], player['losses'], player['moves'],
+                player['mean_move_time'] * 1000, player['max_move_time'] * 1000))
+        print('{} games, {:.2f} games/sec'.format(len(self._results), self.get_games_per_second()))
+        if self._instrument:
+            print()
+            self._call_stats.print_report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play a headless bot tournament.')
+    parser.add_argument('--board-size', type=int, default=8)
+    parser.add_argument('--time-limit', type=float, default=0.1)
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--pairing', choices=[Tournament.ROUND_ROBIN, Tournament.SWISS], default=Tournament.ROUND_ROBIN)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', action='store_true', help='run players in threads instead of worker processes')
+    parser.add_argument('--log', help='file to append the game records to')
+    parser.add_argument('--instrument', action='store_true', help='report call counts and latencies of the engine')
+    parser.add_argument('--profile-dir', help='directory to write cProfile dumps of the games to')
+    parser.add_argument('--track-allocations', action='store_true',
+                        help='also report the memory allocated by the engine calls, with tracemalloc')
+    args = parser.parse_args()
+
+    # Edit this list to include your players
+    players = [SimpleAI, AlphaBetaAI]
+    tournament = Tournament(players, args.board_size, args.time_limit, args.workers, not args.threads, args.log,
+                            args.instrument, args.profile_dir, args.track_allocations)
+    for result in tournament.run(args.pairing, args.rounds):
+        print('Game {}: {} (white) vs {} (black): {}'.format(
+            result.game_id, tournament.get_player_name(result.white), tournament.get_player_name(result.black),
+            {'w': 'white wins', 'b': 'black wins', 'd': 'draw'}[result.winner]))
+    tournament.print_report()
+
+
+if __name__ == '__main__':
+    main()